@@ -0,0 +1,64 @@
+import re
+import unicodedata
+from typing import Optional
+
+# 단어 (문자, 숫자, _)와 문장부호를 따로 나누는 정규식 ("said." -> "said", ".")
+PUNCT_PATTERN = r"\w+|[^\w\s]+"
+
+
+class PreTokenizer:
+    # 학습과 토큰화 전에 문장을 단어로 나누는 단계
+    # 기본값은 str.split()과 같음 (띄어쓰기 단위, 정규화 없음)
+    # pattern: 단어 하나에 맞는 정규식 (생성할 때 한 번만 compile, 띄어쓰기로 나눈 조각마다 findall)
+    # normalization: unicodedata.normalize 형식 ('NFC', 'NFKC', 'NFD', 'NFKD'), None이면 정규화하지 않음
+    # memo_size: 띄어쓰기로 나눈 조각 -> 나눈 단어를 기억할 최대 조각 수
+    #            자주 나오는 조각은 앞에서부터 나오므로 꽉 차면 더 추가하지 않음
+    def __init__(self, pattern: Optional[str] = None, normalization: Optional[str] = None,
+                 memo_size: int = 100000) -> None:
+        if normalization is not None and normalization not in ('NFC', 'NFKC', 'NFD', 'NFKD'):
+            raise ValueError(f"unknown normalization: {normalization}")
+        self.pattern = pattern
+        self.normalization = normalization
+        self.memo_size = memo_size
+        self.regex = re.compile(pattern) if pattern is not None else None
+        # findall은 group이 있으면 group만 반환하므로 허용하지 않음
+        if self.regex is not None and self.regex.groups:
+            raise ValueError("pattern must not contain capturing groups")
+        self.memo = {}
+
+    # return: text를 나눈 단어 list
+    def __call__(self, text: str) -> list[str]:
+        if self.regex is None and self.normalization is None:
+            return text.split()
+        memo = self.memo
+        words = []
+        for chunk in text.split():
+            pieces = memo.get(chunk)
+            if pieces is None:
+                pieces = self._split_chunk(chunk)
+                if len(memo) < self.memo_size:
+                    memo[chunk] = pieces
+            words.extend(pieces)
+        return words
+
+    def _split_chunk(self, chunk: str) -> tuple[str, ...]:
+        if self.normalization is not None:
+            chunk = unicodedata.normalize(self.normalization, chunk)
+        if self.regex is None:
+            return tuple(chunk.split())
+        return tuple(self.regex.findall(chunk))
+
+    # 단어 빈도 cache key 등에 쓰는 설정 (기본값이면 "whitespace")
+    def settings(self):
+        if self.pattern is None and self.normalization is None:
+            return "whitespace"
+        return {"pattern": self.pattern, "normalization": self.normalization}
+
+    # 다른 process에 보낼 때 memo는 빼고 보냄
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['memo'] = {}
+        return state
+
+    def __repr__(self) -> str:
+        return f"PreTokenizer(pattern={self.pattern!r}, normalization={self.normalization!r})"
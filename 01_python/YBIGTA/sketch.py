@@ -0,0 +1,123 @@
+import heapq
+import zlib
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+# sketch에 한 번에 더하는 pair 수
+BATCH_SIZE = 1 << 16
+
+# pair 문자열 -> crc32 (Python의 str hash는 process마다 달라서 사용하지 않음)
+def _pair_hash(pair: tuple[str, str]) -> int:
+    return zlib.crc32(f'{pair[0]}\0{pair[1]}'.encode('utf-8'))
+
+# vocab의 단어마다 모든 인접 pair와 그 단어의 빈도를 차례로 yield (get_stats와 같은 pair)
+def _iter_pairs(vocab: dict[str, int]) -> Iterable[tuple[tuple[str, str], int]]:
+    for word, freq in vocab.items():
+        symbols = word.split()
+        for pair in zip(symbols, symbols[1:]):
+            yield pair, freq
+
+
+class CountMinSketch:
+    # 고정된 크기의 (depth, width) 표에 빈도를 더하는 count-min sketch
+    # 추정값은 항상 실제 빈도 이상이고, 다른 key와 겹친 만큼만 커짐
+    # width: 행 하나의 칸 수 (2의 거듭제곱), depth: 행 수 (행마다 다른 hash)
+    def __init__(self, width: int = 1 << 20, depth: int = 4, seed: int = 0) -> None:
+        if width < 2 or width & (width - 1):
+            raise ValueError("width must be a power of two")
+        self.width = width
+        self.depth = depth
+        self.shift = np.uint64(64 - width.bit_length() + 1)
+        rng = np.random.default_rng(seed)
+        # 행마다 다른 홀수를 곱하는 multiplicative hashing
+        self.multipliers = rng.integers(1, 1 << 63, size=depth, dtype=np.uint64) | np.uint64(1)
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    # hashes: crc32 값 배열, return: (depth, len(hashes)) 칸 index
+    def _indices(self, hashes: np.ndarray) -> np.ndarray:
+        return (hashes[None, :] * self.multipliers[:, None]) >> self.shift
+
+    def add(self, hashes: np.ndarray, counts: np.ndarray) -> None:
+        for row, indices in zip(self.table, self._indices(hashes)):
+            row += np.bincount(indices, weights=counts, minlength=self.width).astype(np.int64)
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        indices = self._indices(hashes)
+        return np.min([row[index] for row, index in zip(self.table, indices)], axis=0)
+
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class TopPairs(NamedTuple):
+    counts: dict[tuple[str, str], int]  # 후보 pair의 정확한 빈도
+    cutoff: int                         # 후보가 아닌 pair의 빈도는 이 값 이하
+
+    # return: 빈도가 cutoff보다 큰 pair 전부 (get_stats에서 같은 조건으로 고른 것과 같음)
+    def exact(self) -> dict[tuple[str, str], int]:
+        return {pair: count for pair, count in self.counts.items() if count > self.cutoff}
+
+    # return: get_stats + get_best_pair와 같은 pair, 후보만으로 확정할 수 없으면 None
+    def best(self) -> Optional[tuple[str, str]]:
+        exact = self.exact()
+        if not exact:
+            return None
+        return min(exact, key=lambda pair: (-exact[pair], pair))
+
+
+# get_stats처럼 모든 pair의 빈도를 dict에 저장하지 않고 빈도가 높은 pair만 찾음
+# 1. vocab을 훑으면서 pair 빈도를 CountMinSketch에 더함 (메모리는 width * depth로 고정)
+# 2. 다시 훑으면서 추정값이 가장 큰 서로 다른 pair n_candidates개를 후보로 고름
+# 3. 한 번 더 훑으면서 후보 pair의 빈도만 정확히 셈
+# 추정값은 실제 빈도 이상이므로 후보에서 밀려난 pair의 빈도는 cutoff (밀려난 추정값의 최댓값) 이하
+# k: 찾을 pair 수, n_candidates: 후보 수 (기본 4 * k)
+def get_top_pairs(vocab: dict[str, int], k: int, n_candidates: Optional[int] = None,
+                  width: int = 1 << 20, depth: int = 4) -> TopPairs:
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if n_candidates is None:
+        n_candidates = 4 * k
+    if n_candidates < k:
+        raise ValueError("n_candidates must be at least k")
+    sketch = CountMinSketch(width, depth)
+    for pairs, hashes, freqs in _batches(vocab):
+        sketch.add(hashes, freqs)
+
+    # (추정값, pair)의 min heap, candidates: 후보 pair 집합
+    heap = []
+    candidates = set()
+    cutoff = 0
+    for pairs, hashes, freqs in _batches(vocab):
+        for pair, estimate in zip(pairs, sketch.estimate(hashes).tolist()):
+            if pair in candidates:
+                continue
+            if len(heap) < n_candidates:
+                heapq.heappush(heap, (estimate, pair))
+                candidates.add(pair)
+            elif estimate > heap[0][0]:
+                evicted, evicted_pair = heapq.heapreplace(heap, (estimate, pair))
+                candidates.discard(evicted_pair)
+                candidates.add(pair)
+                cutoff = max(cutoff, evicted)
+            else:
+                cutoff = max(cutoff, estimate)
+
+    counts = dict.fromkeys(candidates, 0)
+    for pair, freq in _iter_pairs(vocab):
+        if pair in counts:
+            counts[pair] += freq
+    return TopPairs(counts, cutoff)
+
+# vocab의 pair를 BATCH_SIZE개씩 (pair list, crc32 배열, 빈도 배열)로 묶음
+def _batches(vocab: dict[str, int]):
+    pairs, hashes, freqs = [], [], []
+    for pair, freq in _iter_pairs(vocab):
+        pairs.append(pair)
+        hashes.append(_pair_hash(pair))
+        freqs.append(freq)
+        if len(pairs) >= BATCH_SIZE:
+            yield pairs, np.asarray(hashes, dtype=np.uint64), np.asarray(freqs, dtype=np.float64)
+            pairs, hashes, freqs = [], [], []
+    if pairs:
+        yield pairs, np.asarray(hashes, dtype=np.uint64), np.asarray(freqs, dtype=np.float64)
@@ -0,0 +1,396 @@
+import collections
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from collections.abc import Iterator, Mapping, Sequence
+from typing import NamedTuple
+
+import numpy as np
+
+# 학습된 tokenizer를 저장하는 binary 파일 형식 (little endian)
+#   header: magic, version, kind, 토큰 수, merge 수, 문자열 blob 크기, 토큰 index 크기, merge index 크기
+#   ids:     int32[토큰 수]       string table 순서대로 각 토큰의 vocab 값
+#   merges:  int32[merge 수, 2]   merge 순서(rank)대로 (첫 번째, 두 번째) 토큰의 string table index
+#   offsets: uint32[토큰 수 + 1]  blob 안에서 각 토큰의 byte 위치
+#   token index: int32[토큰 index 크기]  토큰 문자열 crc32로 찾는 open addressing hash table (빈 칸 = -1)
+#   merge index: int32[merge index 크기] (첫 번째, 두 번째) 토큰 index의 crc32로 merge 순서를 찾는 hash table
+#   blob:    utf-8로 이어 붙인 토큰 문자열
+# hash index는 attach에서 dict를 만들지 않고 파일에서 바로 찾을 때 사용
+# (Python의 str hash는 process마다 달라서 crc32를 사용)
+MAGIC = b'YBTK'
+VERSION = 2
+HEADER = struct.Struct('<4sI4sIIQII4x')
+# hash index가 없는 이전 형식
+HEADER_V1 = struct.Struct('<4sI4sIIQ4x')
+PAIR = struct.Struct('<ii')
+
+class TokenizerFile(NamedTuple):
+    kind: str
+    tokens: list[str]
+    ids: list[int]
+    merges: list[tuple[int, int]]
+
+def _pair_hash(first: int, second: int) -> int:
+    return zlib.crc32(PAIR.pack(first, second))
+
+# keys의 hash로 만든 open addressing (linear probing) hash table, 크기는 key 수의 2배 이상인 2의 거듭제곱
+def _build_index(hashes: list[int]) -> np.ndarray:
+    size = 1
+    while size < 2 * len(hashes):
+        size *= 2
+    mask = size - 1
+    slots = [-1] * size
+    for i, h in enumerate(hashes):
+        j = h & mask
+        while slots[j] != -1:
+            j = (j + 1) & mask
+        slots[j] = i
+    return np.asarray(slots, dtype='<i4')
+
+# kind: tokenizer 종류 ('bpe', 'word')
+def write_tokenizer_file(path: str, kind: str, tokens: list[str], ids: list[int], merges: list[tuple[int, int]]) -> None:
+    encoded = [token.encode('utf-8') for token in tokens]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(token) for token in encoded], out=offsets[1:])
+    blob = b''.join(encoded)
+    token_index = _build_index([zlib.crc32(token) for token in encoded])
+    merge_index = _build_index([_pair_hash(first, second) for first, second in merges])
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, kind.encode('ascii'), len(tokens), len(merges), len(blob),
+                            len(token_index), len(merge_index)))
+        f.write(np.asarray(ids, dtype='<i4').tobytes())
+        f.write(np.asarray(merges, dtype='<i4').reshape(-1, 2).tobytes())
+        f.write(offsets.tobytes())
+        f.write(token_index.tobytes())
+        f.write(merge_index.tobytes())
+        f.write(blob)
+
+# return: (kind, 토큰 수, merge 수, blob 크기, 토큰 index 크기, merge index 크기, 배열 시작 위치)
+def _read_header(mm, path: str) -> tuple:
+    magic, version = struct.unpack_from('<4sI', mm, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a tokenizer file")
+    if version == 1:
+        _, _, kind, n_tokens, n_merges, blob_size = HEADER_V1.unpack_from(mm, 0)
+        index_sizes, pos = (0, 0), HEADER_V1.size
+    elif version == VERSION:
+        _, _, kind, n_tokens, n_merges, blob_size, *index_sizes = HEADER.unpack_from(mm, 0)
+        pos = HEADER.size
+    else:
+        raise ValueError(f"Unsupported tokenizer file version: {version}")
+    return (kind.rstrip(b'\0').decode('ascii'), n_tokens, n_merges, blob_size, *index_sizes, pos)
+
+# 파일을 mmap으로 열어서 복사 없이 배열을 읽음
+# 여러 process가 같은 파일을 load하면 OS page cache를 공유함
+def read_tokenizer_file(path: str) -> TokenizerFile:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        kind, n_tokens, n_merges, blob_size, token_index_size, merge_index_size, pos = _read_header(mm, path)
+        ids = np.frombuffer(mm, dtype='<i4', count=n_tokens, offset=pos)
+        pos += ids.nbytes
+        merges = np.frombuffer(mm, dtype='<i4', count=2 * n_merges, offset=pos)
+        pos += merges.nbytes
+        offsets = np.frombuffer(mm, dtype='<u4', count=n_tokens + 1, offset=pos)
+        pos += offsets.nbytes + 4 * (token_index_size + merge_index_size)
+        blob = mm[pos:pos + blob_size]
+        bounds = offsets.tolist()
+        tokens = [blob[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+        result = TokenizerFile(
+            kind,
+            tokens,
+            ids.tolist(),
+            [tuple(pair) for pair in merges.reshape(-1, 2).tolist()],
+        )
+        # mmap을 닫기 전에 mmap을 참조하는 배열을 해제
+        del ids, merges, offsets
+    return result
+
+# tokenizer 파일을 mmap으로 열어 두고 dict로 복사하지 않고 hash index로 바로 찾음
+# 여러 process가 같은 파일을 열면 OS page cache의 같은 page를 읽기 전용으로 공유
+# (공유 메모리에 두려면 /dev/shm 아래 경로에 저장)
+# pickle하면 경로만 넘기고 받는 쪽에서 다시 mmap으로 열음
+class MappedTokenizerFile:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (self.kind, self.n_tokens, self.n_merges, blob_size,
+         token_index_size, merge_index_size, pos) = _read_header(self._mm, path)
+        if token_index_size == 0:
+            raise ValueError(f"{path} has no hash index, save the tokenizer again to attach it")
+        # 파일은 little endian이므로 little endian machine에서는 memoryview로 바로 읽음
+        if sys.byteorder != 'little':
+            raise ValueError("Attaching tokenizer files needs a little endian machine, use load instead")
+        buf = memoryview(self._mm)
+        sections = []
+        for size, fmt in ((self.n_tokens, 'i'), (2 * self.n_merges, 'i'), (self.n_tokens + 1, 'I'),
+                          (token_index_size, 'i'), (merge_index_size, 'i')):
+            sections.append(buf[pos:pos + 4 * size].cast(fmt))
+            pos += 4 * size
+        self.ids, self.merges, self.offsets, self.token_index, self.merge_index = sections
+        self.blob = buf[pos:pos + blob_size]
+        self._token_mask = token_index_size - 1
+        self._merge_mask = merge_index_size - 1
+
+    def __reduce__(self):
+        return MappedTokenizerFile, (self.path,)
+
+    # return: string table index의 토큰 문자열
+    def token(self, index: int) -> str:
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    # return: 토큰의 string table index, 없으면 -1
+    def find(self, token: str) -> int:
+        encoded = token.encode('utf-8')
+        slots, offsets, blob = self.token_index, self.offsets, self.blob
+        j = zlib.crc32(encoded) & self._token_mask
+        while True:
+            index = slots[j]
+            if index < 0 or blob[offsets[index]:offsets[index + 1]] == encoded:
+                return index
+            j = (j + 1) & self._token_mask
+
+    # first, second: 토큰의 string table index
+    # return: (first, second) merge의 순서, 없으면 -1
+    def find_merge(self, first: int, second: int) -> int:
+        slots, merges = self.merge_index, self.merges
+        j = _pair_hash(first, second) & self._merge_mask
+        while True:
+            rank = slots[j]
+            if rank < 0 or (merges[2 * rank] == first and merges[2 * rank + 1] == second):
+                return rank
+            j = (j + 1) & self._merge_mask
+
+# MappedTokenizerFile의 {토큰: vocab 값} 읽기 전용 view
+class MappedVocab(Mapping):
+    def __init__(self, file: MappedTokenizerFile) -> None:
+        self.file = file
+
+    def __len__(self) -> int:
+        return self.file.n_tokens
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.file.token, range(self.file.n_tokens))
+
+    def __contains__(self, token) -> bool:
+        return isinstance(token, str) and self.file.find(token) >= 0
+
+    def __getitem__(self, token: str) -> int:
+        index = self.file.find(token)
+        if index < 0:
+            raise KeyError(token)
+        return self.file.ids[index]
+
+    def get(self, token: str, default=None):
+        index = self.file.find(token)
+        return default if index < 0 else self.file.ids[index]
+
+# MappedTokenizerFile의 merge 순서대로 (첫 번째, 두 번째) 토큰 list 읽기 전용 view
+class MappedMerges(Sequence):
+    def __init__(self, file: MappedTokenizerFile) -> None:
+        self.file = file
+
+    def __len__(self) -> int:
+        return self.file.n_merges
+
+    def __getitem__(self, rank):
+        if isinstance(rank, slice):
+            return [self[i] for i in range(*rank.indices(len(self)))]
+        if rank < 0:
+            rank += len(self)
+        if not 0 <= rank < len(self):
+            raise IndexError(rank)
+        merges, token = self.file.merges, self.file.token
+        return token(merges[2 * rank]), token(merges[2 * rank + 1])
+
+# MappedTokenizerFile의 {(첫 번째, 두 번째) 토큰: merge 순서} 읽기 전용 view
+class MappedRanks(Mapping):
+    def __init__(self, file: MappedTokenizerFile) -> None:
+        self.file = file
+
+    def __len__(self) -> int:
+        return self.file.n_merges
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        return iter(MappedMerges(self.file))
+
+    def _rank(self, pair) -> int:
+        first = self.file.find(pair[0])
+        if first < 0:
+            return -1
+        second = self.file.find(pair[1])
+        if second < 0:
+            return -1
+        return self.file.find_merge(first, second)
+
+    def __contains__(self, pair) -> bool:
+        return self._rank(pair) >= 0
+
+    def __getitem__(self, pair: tuple[str, str]) -> int:
+        rank = self._rank(pair)
+        if rank < 0:
+            raise KeyError(pair)
+        return rank
+
+    def get(self, pair: tuple[str, str], default=None):
+        rank = self._rank(pair)
+        return default if rank < 0 else rank
+
+# 단어 빈도 cache 파일 형식 (little endian)
+#   header:  magic, version, 단어 수, 문자열 blob 크기
+#   freqs:   uint64[단어 수]      각 단어의 빈도
+#   offsets: uint64[단어 수 + 1]  blob 안에서 각 단어의 byte 위치
+#   blob:    utf-8로 이어 붙인 단어 문자열
+COUNTS_MAGIC = b'YBWC'
+COUNTS_VERSION = 1
+COUNTS_HEADER = struct.Struct('<4sIQQ')
+
+# settings: corpus 출처, 문서 수, 전처리 설정 등 단어 빈도를 결정하는 값 (json으로 바꿀 수 있어야 함)
+# return: settings가 같으면 같은 16진수 문자열
+def corpus_fingerprint(**settings) -> str:
+    key = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+# counts: {단어: 빈도}
+# 쓰는 도중 중단되어도 깨진 cache가 남지 않도록 임시 파일에 쓴 뒤 교체
+def write_counts_file(path: str, counts: dict[str, int]) -> None:
+    encoded = [word.encode('utf-8') for word in counts]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(word) for word in encoded], out=offsets[1:])
+    blob = b''.join(encoded)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(COUNTS_HEADER.pack(COUNTS_MAGIC, COUNTS_VERSION, len(encoded), len(blob)))
+        f.write(np.fromiter(counts.values(), dtype='<u8', count=len(encoded)).tobytes())
+        f.write(offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+# return: write_counts_file로 저장한 {단어: 빈도}, 저장할 때의 단어 순서 유지
+def read_counts_file(path: str) -> collections.Counter:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, n_words, blob_size = COUNTS_HEADER.unpack_from(mm, 0)
+        if magic != COUNTS_MAGIC:
+            raise ValueError(f"{path} is not a word count file")
+        if version != COUNTS_VERSION:
+            raise ValueError(f"Unsupported word count file version: {version}")
+        pos = COUNTS_HEADER.size
+        freqs = np.frombuffer(mm, dtype='<u8', count=n_words, offset=pos)
+        pos += freqs.nbytes
+        offsets = np.frombuffer(mm, dtype='<u8', count=n_words + 1, offset=pos)
+        pos += offsets.nbytes
+        blob = mm[pos:pos + blob_size]
+        bounds = offsets.tolist()
+        words = [blob[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+        counts = collections.Counter(dict(zip(words, freqs.tolist())))
+        # mmap을 닫기 전에 mmap을 참조하는 배열을 해제
+        del freqs, offsets
+    return counts
+
+
+# 토큰화한 corpus 파일 형식 (little endian)
+#   token 파일: 모든 문서의 토큰 id를 이어 붙인 uint16 또는 uint32 배열 (header 없음)
+#   index 파일 (token 파일 경로 + '.idx'):
+#     header:  magic, version, 토큰 id의 byte 크기 (2, 4), 문서 수, 토큰 수
+#     offsets: uint64[문서 수 + 1]  token 파일 안에서 각 문서의 토큰 위치
+TOKENS_MAGIC = b'YBTI'
+TOKENS_VERSION = 1
+TOKENS_HEADER = struct.Struct('<4sII4xQQ')
+
+def _index_path(path: str) -> str:
+    return path + '.idx'
+
+# 문서를 차례로 받아서 token 파일과 index 파일에 바로 씀 (메모리에는 한 번에 받은 문서만 올라감)
+# 임시 파일 (경로 + '.tmp')에 쓰고 close에서 header를 채운 뒤 교체하므로
+# 쓰는 중에 에러가 나면 (with에서 예외, abort) 임시 파일만 지우고 기존 파일은 그대로 남음
+# vocab_size: 토큰 id가 모두 이 값보다 작음, 2 ** 16 이하면 uint16으로 저장
+class TokenFileWriter:
+    def __init__(self, path: str, vocab_size: int) -> None:
+        self.path = path
+        self.dtype = np.dtype('<u2') if vocab_size <= 2 ** 16 else np.dtype('<u4')
+        self.n_docs = 0
+        self.n_tokens = 0
+        self._tokens = open(path + '.tmp', 'wb')
+        self._index = open(_index_path(path) + '.tmp', 'wb')
+        # 문서 수, 토큰 수는 close에서 채움
+        self._index.write(TOKENS_HEADER.pack(TOKENS_MAGIC, TOKENS_VERSION, self.dtype.itemsize, 0, 0))
+        self._index.write(np.zeros(1, dtype='<u8').tobytes())
+
+    # docs: 문서마다 토큰 id list
+    def write(self, docs: list[list[int]]) -> None:
+        lengths = np.fromiter(map(len, docs), dtype='<u8', count=len(docs))
+        total = int(lengths.sum())
+        tokens = np.fromiter(itertools.chain.from_iterable(docs), dtype=self.dtype, count=total)
+        self._tokens.write(tokens.tobytes())
+        offsets = np.cumsum(lengths, dtype='<u8') + np.uint64(self.n_tokens)
+        self._index.write(offsets.tobytes())
+        self.n_docs += len(docs)
+        self.n_tokens += total
+
+    # header를 채우고 임시 파일을 path로 교체 (index 파일을 마지막에 교체)
+    def close(self) -> None:
+        if self._tokens.closed:
+            return
+        self._tokens.close()
+        self._index.seek(0)
+        self._index.write(TOKENS_HEADER.pack(TOKENS_MAGIC, TOKENS_VERSION, self.dtype.itemsize,
+                                             self.n_docs, self.n_tokens))
+        self._index.close()
+        os.replace(self.path + '.tmp', self.path)
+        os.replace(_index_path(self.path) + '.tmp', _index_path(self.path))
+
+    # 쓰던 임시 파일을 지움
+    def abort(self) -> None:
+        self._tokens.close()
+        self._index.close()
+        for tmp_path in (self.path + '.tmp', _index_path(self.path) + '.tmp'):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __enter__(self) -> 'TokenFileWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# TokenFileWriter로 쓴 파일을 np.memmap으로 열어서 문서를 복사 없이 읽음
+# 읽은 부분만 OS가 page 단위로 메모리에 올림
+class TokenFile(Sequence):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        index_path = _index_path(path)
+        with open(index_path, 'rb') as f:
+            magic, version, itemsize, n_docs, n_tokens = TOKENS_HEADER.unpack(f.read(TOKENS_HEADER.size))
+        if magic != TOKENS_MAGIC:
+            raise ValueError(f"{index_path} is not a token index file")
+        if version != TOKENS_VERSION:
+            raise ValueError(f"Unsupported token index file version: {version}")
+        # offsets: (문서 수 + 1,) uint64, tokens: (토큰 수,) uint16 또는 uint32
+        self.offsets = np.memmap(index_path, dtype='<u8', mode='r', offset=TOKENS_HEADER.size, shape=(n_docs + 1,))
+        dtype = '<u2' if itemsize == 2 else '<u4'
+        # 빈 파일은 memmap할 수 없음
+        self.tokens = np.memmap(path, dtype=dtype, mode='r') if n_tokens else np.zeros(0, dtype=dtype)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    # return: index번째 문서의 토큰 id (token 파일의 view)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    # return: 문서별 토큰 수
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
\ No newline at end of file
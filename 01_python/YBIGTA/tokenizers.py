@@ -1,20 +1,118 @@
-from typing import Optional
-from typing import Union
-import collections, re
-
+import abc
 import collections
+import contextlib
+import copy
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
 import re
-from typing import Optional, Union
+import resource
+import sys
+import time
+from array import array
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
 
-def get_vocab(corpus: list[str]) -> dict[str, int]:
-    vocab = collections.defaultdict(int)
-    for line in corpus:
-        words = line.split()
-        for word in words:
-            vocab[word] += 1
+import numpy as np
+
+from .pretokenizer import PreTokenizer
+from .sketch import get_top_pairs
+from .storage import (
+    MappedMerges, MappedRanks, MappedTokenizerFile, MappedVocab, TokenFile, TokenFileWriter, read_tokenizer_file,
+    write_tokenizer_file,
+)
+
+# 단어 끝 표시, pad/unk 토큰
+EOW = '</w>'
+PAD = '<pad>'
+UNK = '<unk>'
+
+# num_workers > 1일 때 process 하나에 넘기는 문장 수
+CHUNK_SIZE = 1000
+
+# corpus의 일부에서 단어의 빈도를 셈 (process pool에서 실행)
+# pre_tokenizer: 문장을 단어로 나누는 PreTokenizer, None이면 띄어쓰기 단위
+def _count_chunk(chunk: Iterable[str], pre_tokenizer: Optional[PreTokenizer] = None) -> collections.Counter:
+    split = str.split if pre_tokenizer is None else pre_tokenizer
+    return collections.Counter(word for line in chunk for word in split(line))
+
+# corpus를 chunk_size 문장씩 나눔
+def _split_chunks(corpus, chunk_size: int):
+    iterator = iter(corpus)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# num_workers: 단어 빈도를 셀 process 수, 1이면 현재 process에서 셈
+# pre_tokenizer: 문장을 단어로 나누는 PreTokenizer, None이면 띄어쓰기 단위
+# return: {단어: 빈도}, num_workers와 상관없이 같은 결과
+def count_words(corpus: Iterable[str], num_workers: int = 1,
+                pre_tokenizer: Optional[PreTokenizer] = None) -> collections.Counter:
+    if num_workers <= 1:
+        return _count_chunk(corpus, pre_tokenizer)
+    counts = collections.Counter()
+    chunks = _split_chunks(corpus, CHUNK_SIZE)
+    first = next(chunks, None)
+    # 셀 문장이 없으면 pool을 띄우지 않음
+    if first is None:
+        return counts
+    with multiprocessing.Pool(num_workers) as pool:
+        # corpus가 generator여도 메모리에 올라가는 chunk 수가 제한되도록 일정 개수만 넘김
+        # chunk 순서대로 합쳐서 단어가 처음 나온 순서도 serial과 같게 유지
+        pending = collections.deque()
+        for chunk in itertools.chain([first], chunks):
+            pending.append(pool.apply_async(_count_chunk, (chunk, pre_tokenizer)))
+            if len(pending) >= 2 * num_workers:
+                counts.update(pending.popleft().get())
+        while pending:
+            counts.update(pending.popleft().get())
+    return counts
+
+# table: id -> 문자열 배열 (BaseTokenizer._get_decode_table)
+# return: ids 모양 그대로 문자열로 바꾼 배열
+# 음수 id가 table 끝에서부터 index되지 않도록 범위를 벗어난 id는 ValueError
+def _lookup_pieces(table: np.ndarray, ids) -> np.ndarray:
+    ids = np.asarray(ids, dtype=np.intp)
+    if ids.size and (ids.min() < 0 or ids.max() >= len(table)):
+        bad = ids[(ids < 0) | (ids >= len(table))].flat[0]
+        raise ValueError(f"token id {bad} is out of range for vocab of size {len(table)}")
+    return table[ids]
+
+# 병렬 토큰화에서 각 worker process가 사용하는 tokenizer (pool 시작 시 한 번만 전달)
+_worker_tokenizer = None
+
+def _init_encode_worker(tokenizer) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+def _encode_chunk(chunk: list[str]) -> list[list[int]]:
+    return [_worker_tokenizer._encode(sentence) for sentence in chunk]
+
+# pre_tokenizer: count_words 참고
+# return: {문자 단위로 띄어쓰고 단어 끝 표시를 붙인 단어: 빈도}
+def get_vocab(corpus: Iterable[str], num_workers: int = 1,
+              pre_tokenizer: Optional[PreTokenizer] = None) -> dict[str, int]:
+    return split_words(count_words(corpus, num_workers, pre_tokenizer))
+
+# counts: {단어: 빈도}
+# return: {문자 단위로 띄어쓰고 단어 끝 표시를 붙인 단어: 빈도}
+def split_words(counts: dict[str, int]) -> dict[str, int]:
+    vocab = {}
+    for word, freq in counts.items():
+        vocab[' '.join(word) + ' ' + EOW] = freq
     return vocab
 
-def get_stats(vocab: dict[str, int]):
+# approximate: True이면 모든 pair의 빈도를 dict에 저장하지 않고 CountMinSketch로 빈도가 높은 pair만 찾음
+#              (sketch.get_top_pairs 참고, 메모리는 sketch 크기와 후보 수로 고정)
+#              빈도가 가장 높은 pair부터 순위가 확정된 pair만 정확한 빈도로 반환하므로 get_best_pair 결과는 같음
+# k, width, depth: approximate일 때 get_top_pairs에 넘기는 값
+def get_stats(vocab: dict[str, int], approximate: bool = False, k: int = 1024,
+              width: int = 1 << 20, depth: int = 4):
+    if approximate:
+        return get_top_pairs(vocab, k, width=width, depth=depth).exact()
     pairs = collections.defaultdict(int)
     for word, freq in vocab.items():
         symbols = word.split()
@@ -25,88 +123,1059 @@ def get_stats(vocab: dict[str, int]):
 def merge_vocab(pair, v_in):
     v_out = {}
     bigram = re.escape(' '.join(pair))
-    p = re.compile(r'(?<!\\S)' + bigram + r'(?!\\S)')
+    p = re.compile(r'(?<!\S)' + bigram + r'(?!\S)')
     for word in v_in:
         w_out = p.sub(''.join(pair), word)
         v_out[w_out] = v_in[word]
     return v_out
 
+# pairs에서 빈도가 가장 높은 pair 반환
+# 빈도가 같으면 사전순으로 앞선 pair를 고름 (BPETrainer와 같은 기준)
+def get_best_pair(pairs):
+    return min(pairs, key=lambda pair: (-pairs[pair], pair))
+
+# merge_batch의 결과
+class MergeBatch(NamedTuple):
+    merges: list[tuple[str, str]]   # merge한 pair 순서
+    frequencies: list[int]          # 각 pair를 merge할 때의 빈도
+    n_pairs: list[int]              # 각 pair를 merge한 뒤 pair 빈도 table의 크기
+    vocab: dict[str, int]           # merge된 vocab
+
+# 빈도가 높은 pair를 최대 n개까지 vocab을 한 번 훑어서 merge
+# 한 번에 하나씩 merge할 때 (get_best_pair) 고르게 되는 pair만 merge하므로 결과가 같음
+# pairs: vocab의 pair 빈도 (get_stats의 결과), merge된 vocab의 pair 빈도로 바뀜
+# min_frequency: 빈도가 이 값보다 작은 pair는 merge하지 않음
+# cutoff: pairs가 빈도가 cutoff보다 큰 pair만 담은 일부일 때 (sketch.get_top_pairs의 exact, cutoff)
+#         pairs에 없는 pair의 빈도는 cutoff 이하로 보고 확정할 수 있는 pair만 merge (pairs는 바꾸지 않음)
+def merge_batch(pairs, vocab: dict[str, int], n: int, min_frequency: Optional[int] = None,
+                cutoff: int = 0) -> MergeBatch:
+    # 전체를 정렬하지 않고 빈도 상위 n개만 후보로 고름
+    candidates = heapq.nsmallest(n, pairs, key=lambda pair: (-pairs[pair], pair))
+    candidates = list(itertools.takewhile(lambda pair: pairs[pair] > cutoff, candidates))
+    if min_frequency is not None:
+        candidates = list(itertools.takewhile(lambda pair: pairs[pair] >= min_frequency, candidates))
+    if not candidates:
+        return MergeBatch([], [], [], vocab)
+    changes, states = _simulate_batch(candidates, vocab)
+    n_accepted, frequencies, sizes = _accept_batch(pairs, candidates, changes, min_frequency, cutoff)
+    merges = candidates[:n_accepted]
+    if cutoff:
+        # pairs가 일부이면 table 크기는 pairs의 크기
+        sizes = [len(pairs)] * n_accepted
+
+    # merge한 단어의 pair 빈도만 갱신
+    v_out = {}
+    for word, freq in vocab.items():
+        history = states.get(word)
+        if history is None:
+            v_out[word] = freq
+            continue
+        symbols = [symbols for start, symbols in history if start <= n_accepted][-1]
+        if len(symbols) < len(history[0][1]) and not cutoff:
+            old_symbols = history[0][1]
+            for pair in zip(old_symbols, old_symbols[1:]):
+                count = pairs[pair] - freq
+                if count > 0:
+                    pairs[pair] = count
+                else:
+                    del pairs[pair]
+            for pair in zip(symbols, symbols[1:]):
+                pairs[pair] = pairs.get(pair, 0) + freq
+        v_out[' '.join(symbols)] = freq
+    return MergeBatch(merges, frequencies, sizes, v_out)
+
+# candidates를 순서대로 vocab의 단어에 merge해 보면서 빈도 변화를 기록
+# return: (changes[t]: 후보 t개를 merge한 시점에 바뀐 pair 빈도,
+#          states[단어]: (이 상태가 시작되는 시점, symbols) list, merge된 단어만)
+def _simulate_batch(candidates: list[tuple[str, str]], vocab: dict[str, int]):
+    # 첫 번째 symbol -> 그 symbol로 시작하는 후보 index
+    by_first = collections.defaultdict(list)
+    for j, (first, second) in enumerate(candidates):
+        by_first[first].append(j)
+
+    # 후보를 순서대로 단어에 merge하면서 단어마다 바뀐 상태를 기록
+    # changes[t]: 후보 t개를 merge한 시점에 바뀐 pair 빈도
+    changes = collections.defaultdict(lambda: collections.defaultdict(int))
+    states = {}
+    for word, freq in vocab.items():
+        symbols = word.split()
+        todo = [j for symbol in set(symbols) for j in by_first.get(symbol, ())]
+        if not todo:
+            continue
+        heapq.heapify(todo)
+        queued = set(todo)
+        # (이 상태가 시작되는 시점, symbols)
+        history = [(0, symbols)]
+        while todo:
+            j = heapq.heappop(todo)
+            new_symbols = _merge_pair(symbols, candidates[j])
+            if len(new_symbols) == len(symbols):
+                continue
+            old_pairs = collections.Counter(zip(symbols, symbols[1:]))
+            new_pairs = collections.Counter(zip(new_symbols, new_symbols[1:]))
+            for pair in old_pairs.keys() | new_pairs.keys():
+                changes[j + 1][pair] += (new_pairs[pair] - old_pairs[pair]) * freq
+            symbols = new_symbols
+            history.append((j + 1, symbols))
+            # merge로 생긴 symbol로 시작하는 뒤의 후보
+            for k in by_first.get(''.join(candidates[j]), ()):
+                if k > j and k not in queued:
+                    queued.add(k)
+                    heapq.heappush(todo, k)
+        if len(history) > 1:
+            states[word] = history
+    return changes, states
+
+# 후보 t개를 merge한 시점에 get_best_pair가 t번째 후보를 고르는지 확인 (merge_batch 참고)
+# return: (merge할 후보 수, 각 후보를 merge할 때의 빈도, 각 후보를 merge한 뒤 pair 빈도 table 크기)
+def _accept_batch(pairs, candidates: list[tuple[str, str]], changes, min_frequency: Optional[int],
+                  cutoff: int) -> tuple[int, list[int], list[int]]:
+    # 처음으로 다른 후보를 고르는 시점에서 멈춤
+    # 빈도가 바뀐 pair는 heap으로, 바뀌지 않은 pair는 원래 순위 (후보 순서)로 비교
+    # pairs에 없는 pair는 빈도를 cutoff (상한)로 보고 비교
+    def rank(pair, count):
+        return -count, pair
+
+    delta = collections.defaultdict(int)
+    heap = []
+    # 후보 t개를 merge한 시점의 pair 빈도 table 크기
+    size = len(pairs)
+
+    # t번째 후보를 merge한 시점의 빈도 변화를 반영
+    def apply_changes(t):
+        nonlocal size
+        for pair, change in changes[t].items():
+            if change:
+                before = pairs.get(pair, cutoff) + delta[pair]
+                delta[pair] += change
+                after = before + change
+                size += (after > 0) - (before > 0)
+                heapq.heappush(heap, rank(pair, after))
+
+    frequencies = [pairs[candidates[0]]]
+    sizes = []
+    n_accepted = len(candidates)
+    for t in range(1, len(candidates)):
+        apply_changes(t)
+        sizes.append(size)
+        # 빈도가 다시 바뀌기 전에 넣은 항목은 버림
+        while heap and -heap[0][0] != pairs.get(heap[0][1], cutoff) + delta[heap[0][1]]:
+            heapq.heappop(heap)
+        pair = candidates[t]
+        count = pairs[pair] + delta[pair]
+        if count <= cutoff or (min_frequency is not None and count < min_frequency):
+            n_accepted = t
+            break
+        current = rank(pair, count)
+        # 빈도가 바뀌지 않은 pair 중 가장 앞서는 것: 뒤의 후보 중 빈도가 그대로인 첫 후보
+        # (후보에 없는 pair는 마지막 후보보다 뒤)
+        unchanged = next((candidates[u] for u in range(t + 1, len(candidates)) if not delta[candidates[u]]),
+                         candidates[-1])
+        if (heap and heap[0] < current) or rank(unchanged, pairs[unchanged]) < current:
+            n_accepted = t
+            break
+        frequencies.append(count)
+    if n_accepted == len(candidates):
+        apply_changes(n_accepted)
+        sizes.append(size)
+    return n_accepted, frequencies, sizes
+
+# merges를 순서대로 vocab에 적용 (vocab 전체를 한 번만 훑음)
+def merge_pairs(merges, v_in):
+    v_out = {}
+    for word, freq in v_in.items():
+        symbols = word.split()
+        for pair in merges:
+            if pair[0] in symbols:
+                symbols = _merge_pair(symbols, pair)
+        v_out[' '.join(symbols)] = freq
+    return v_out
+
+# symbols 안의 pair를 왼쪽부터 겹치지 않게 merge (merge_vocab과 같은 규칙)
+def _merge_pair(symbols: list[str], pair) -> list[str]:
+    first, second = pair
+    new_symbols = []
+    i = 0
+    while i < len(symbols):
+        if i < len(symbols) - 1 and symbols[i] == first and symbols[i + 1] == second:
+            new_symbols.append(first + second)
+            i += 2
+        else:
+            new_symbols.append(symbols[i])
+            i += 1
+    return new_symbols
+
+# 빈도가 높은 pair를 최대 n개까지 한 번에 merge (merge_batch 참고, pairs는 바꾸지 않음)
+# return: (merge한 pair 수, merge된 vocab)
 def merge_n_best(pairs, vocab, n):
     if vocab is None:
         raise ValueError("vocab is not initialized. Train tokenizer first!")
-    
-    # n 개의 가장 높은 빈도를 가진 pair 선택
-    best_n = sorted(pairs, key=pairs.get, reverse=True)[:n]
-    
-    # 이미 선택된 문자를 저장하는 집합
-    selected_chars = set()
+    batch = merge_batch(dict(pairs), vocab, n)
+    return len(batch.merges), batch.vocab
 
-    # 중복되지 않는 새로운 pair를 찾아서 merge
-    num_merged = 0  # 중복되지 않아서 merge한 pair의 수를 계산하는 변수
-    for best in best_n:
-        if num_merged >= n:  # 이미 목표한 수만큼 merge 했으면 종료
+# symbols: 단어를 나눈 symbol
+# ranks: {pair: merge 순서}
+# return: 학습된 merge를 순서(rank)대로 적용한 symbol
+def apply_merges(symbols: list[str], ranks: dict[tuple[str, str], int]) -> list[str]:
+    while len(symbols) > 1:
+        # 단어 안의 pair 중 가장 먼저 학습된 pair
+        pair = min(zip(symbols, symbols[1:]), key=lambda p: ranks.get(p, len(ranks)))
+        if pair not in ranks:
             break
-        if not any(char in selected_chars for char in best):
-            vocab = merge_vocab(best, vocab)
-            selected_chars.update(best)
-            num_merged += 1
-    
-    return num_merged, vocab
+        symbols = _merge_pair(symbols, pair)
+    return symbols
+
+# alphabet: 학습 전 vocab에 있던 기본 symbol
+# merges: 학습된 merge 순서
+# tokens: 이미 id가 정해진 토큰 (id 순서, pad와 unk 포함), 이어서 학습할 때 기존 id를 유지하고 새 토큰만 뒤에 추가
+# return: {토큰: id}, pad = 0, unk = 1
+def build_bpe_vocab(alphabet, merges, tokens: Optional[list[str]] = None) -> dict[str, int]:
+    vocab = {PAD: 0, UNK: 1} if tokens is None else {token: i for i, token in enumerate(tokens)}
+    for token in sorted(alphabet):
+        vocab.setdefault(token, len(vocab))
+    for pair in merges:
+        vocab.setdefault(''.join(pair), len(vocab))
+    return vocab
+
+# BPETrainer.train이 merge마다 callback에 넘기는 학습 상태
+class TrainProgress(NamedTuple):
+    n_merges: int               # 지금까지 merge한 횟수
+    elapsed: float              # 학습 시작 후 걸린 시간 (초)
+    pair: tuple[str, str]       # 이번에 merge한 pair
+    frequency: int              # 이번에 merge한 pair의 빈도
+    n_pairs: int                # pair 빈도 table의 크기
+    vocab_size: int             # pad, unk를 포함한 vocab 크기
+    memory_mb: float            # process의 최대 메모리 사용량 (MB)
+
+# return: 현재 process의 최대 RSS (MB)
+def peak_memory_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux는 KB, macOS는 byte 단위
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+class ProgressLogger:
+    # every merge마다 학습 상태를 출력하는 callback
+    def __init__(self, every: int = 1000) -> None:
+        self.every = every
+
+    def __call__(self, progress: TrainProgress) -> None:
+        if progress.n_merges % self.every == 0:
+            print(f"[{progress.elapsed:.1f}s] merges: {progress.n_merges}, "
+                  f"pair: {progress.pair} ({progress.frequency}), pairs: {progress.n_pairs}, "
+                  f"vocab: {progress.vocab_size}, memory: {progress.memory_mb:.1f}MB")
+
+class BPETrainer:
+    # get_stats + merge_vocab을 매 iteration마다 전체 vocab에 대해 다시 하지 않고
+    # pair 빈도와 pair가 등장하는 단어 index를 유지하면서 merge된 단어만 갱신
+    # 단어는 symbol id의 array('I')로 저장하고 문자열은 symbol table에만 둠
+    # vocab: get_vocab의 결과
+    def __init__(self, vocab: dict[str, int]) -> None:
+        # symbols: id -> symbol 문자열, symbol_ids: symbol 문자열 -> id
+        self.symbols = []
+        self.symbol_ids = {}
+        self.words = [array('I', map(self._symbol_id, word.split())) for word in vocab]
+        self.freqs = list(vocab.values())
+        self.alphabet = set(self.symbols)
+        self.merges = []
+        # 이미 id가 정해진 토큰 (build_bpe_vocab의 tokens), checkpoint에 같이 저장해서 이어서 학습해도 id 유지
+        self.token_order = None
+        self._build_index()
+
+    # pair 빈도, index, heap을 비움 (merge_batch_size 모드처럼 쓰지 않을 때 메모리 절약)
+    # 다음에 필요할 때 _ensure_index가 단어들로부터 다시 만듦
+    def _drop_index(self) -> None:
+        self.pair_counts = None
+        self.where = None
+        self.heap = None
+
+    def _ensure_index(self) -> None:
+        if self.pair_counts is None:
+            self._build_index()
+
+    # 단어들로부터 pair 빈도, pair -> 단어 index, heap을 만듦
+    def _build_index(self) -> None:
+        # (id, id) pair -> 빈도, pair -> pair가 등장하는 단어 index
+        self.pair_counts = collections.defaultdict(int)
+        self.where = collections.defaultdict(set)
+        for idx, (ids, freq) in enumerate(zip(self.words, self.freqs)):
+            for pair in zip(ids, ids[1:]):
+                self.pair_counts[pair] += freq
+                self.where[pair].add(idx)
+        # (-빈도, symbol 문자열 pair, id pair)의 heap
+        # 빈도가 바뀌면 새로 push하고 오래된 항목은 꺼낼 때 버림
+        self.heap = [(-count, self._pair_key(pair), pair) for pair, count in self.pair_counts.items()]
+        heapq.heapify(self.heap)
+
+    # symbol 문자열의 id 반환, 처음 보는 symbol이면 새 id 할당
+    def _symbol_id(self, symbol: str) -> int:
+        if symbol not in self.symbol_ids:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.symbol_ids[symbol]
+
+    # 빈도가 같을 때 get_best_pair와 같이 문자열 사전순으로 고르기 위한 key
+    def _pair_key(self, pair):
+        return self.symbols[pair[0]], self.symbols[pair[1]]
+
+    # 빈도가 가장 높은 pair 반환 (symbol 문자열 pair), 더 merge할 pair가 없으면 None
+    def best_pair(self):
+        best = self._best()
+        return None if best is None else best[0]
+
+    # return: (빈도가 가장 높은 pair, 빈도), 더 merge할 pair가 없으면 None
+    def _best(self):
+        self._ensure_index()
+        while self.heap:
+            neg_count, key, pair = self.heap[0]
+            if self.pair_counts.get(pair) == -neg_count:
+                return key, -neg_count
+            heapq.heappop(self.heap)
+        return None
+
+    # return: {symbol 문자열 pair: 빈도} (ShardedBPETrainer가 처음에 shard별 빈도를 합칠 때 사용)
+    def string_pair_counts(self) -> dict[tuple[str, str], int]:
+        self._ensure_index()
+        return {self._pair_key(pair): count for pair, count in self.pair_counts.items()}
+
+    # candidates (symbol 문자열 pair)를 순서대로 merge하면 pair 빈도가 어떻게 바뀌는지 (merge는 하지 않음)
+    # 후보 pair가 있는 단어의 id array 복사본에서만 merge해 봄 (ShardedBPETrainer에서 shard마다 계산해서 합침)
+    # return: {t: 후보 t개를 merge한 시점에 바뀐 pair 빈도}
+    def batch_changes(self, candidates: list[tuple[str, str]]) -> dict[int, dict[tuple[str, str], int]]:
+        self._ensure_index()
+        # 후보 merge로 새로 생기는 symbol은 등록하지 않고 임시 id를 씀
+        new_ids = {}
+
+        def symbol_id(symbol):
+            i = self.symbol_ids.get(symbol)
+            if i is None:
+                i = new_ids.setdefault(symbol, len(self.symbols) + len(new_ids))
+            return i
+
+        steps = []
+        indices = set()
+        for first, second in candidates:
+            pair = (symbol_id(first), symbol_id(second))
+            steps.append((pair, symbol_id(first + second)))
+            # 앞의 후보로 생기는 pair는 그 후보가 있는 단어에만 나오므로 지금 있는 pair의 단어만 보면 됨
+            indices.update(self.where.get(pair, ()))
+        changes = collections.defaultdict(lambda: collections.defaultdict(int))
+        for idx in indices:
+            ids = self.words[idx].tolist()
+            freq = self.freqs[idx]
+            for t, ((first, second), merged) in enumerate(steps, 1):
+                if first not in ids:
+                    continue
+                new = []
+                n = len(ids)
+                i = 0
+                while i < n:
+                    if ids[i] == first and i < n - 1 and ids[i + 1] == second:
+                        new.append(merged)
+                        i += 2
+                    else:
+                        new.append(ids[i])
+                        i += 1
+                if len(new) == n:
+                    continue
+                changed = changes[t]
+                for pair in zip(ids, ids[1:]):
+                    changed[pair] -= freq
+                for pair in zip(new, new[1:]):
+                    changed[pair] += freq
+                ids = new
+        names = self.symbols + list(new_ids)
+        return {t: {(names[first], names[second]): change for (first, second), change in changed.items() if change}
+                for t, changed in changes.items()}
+
+    # pad, unk를 포함해서 지금까지 merge한 결과로 만들어질 vocab 크기 (build_bpe_vocab과 같음)
+    def vocab_size(self) -> int:
+        return len(self.symbols) + 2
+
+    # pair가 등장하는 단어만 merge하고 그 단어들의 pair 빈도만 갱신
+    # pair: symbol 문자열 pair
+    # return: {id pair: 빈도 변화} (0인 항목도 있음)
+    def merge(self, pair) -> dict[tuple[int, int], int]:
+        self._ensure_index()
+        # 다른 shard에서 고른 pair는 이 단어들에 없는 symbol일 수 있음 (ShardedBPETrainer)
+        if pair[0] not in self.symbol_ids or pair[1] not in self.symbol_ids:
+            self._symbol_id(pair[0] + pair[1])
+            self.merges.append(pair)
+            return {}
+        first, second = self.symbol_ids[pair[0]], self.symbol_ids[pair[1]]
+        id_pair = (first, second)
+        merged = self._symbol_id(pair[0] + pair[1])
+        deltas = collections.defaultdict(int)
+        for idx in self.where.pop(id_pair, ()):
+            ids = self.words[idx]
+            old_pairs = collections.Counter(zip(ids, ids[1:]))
+            # 새 문자열을 만들지 않고 array 안에서 pair를 merge된 id로 바꿈
+            n = len(ids)
+            i = j = 0
+            while i < n:
+                if ids[i] == first and i < n - 1 and ids[i + 1] == second:
+                    ids[j] = merged
+                    i += 2
+                else:
+                    ids[j] = ids[i]
+                    i += 1
+                j += 1
+            del ids[j:]
+            freq = self.freqs[idx]
+            new_pairs = collections.Counter(zip(ids, ids[1:]))
+            for old_pair, count in old_pairs.items():
+                deltas[old_pair] -= count * freq
+                if old_pair not in new_pairs and old_pair != id_pair:
+                    self.where[old_pair].discard(idx)
+            for new_pair, count in new_pairs.items():
+                deltas[new_pair] += count * freq
+                self.where[new_pair].add(idx)
+
+        for changed, delta in deltas.items():
+            if delta == 0:
+                continue
+            count = self.pair_counts[changed] + delta
+            if count > 0:
+                self.pair_counts[changed] = count
+                heapq.heappush(self.heap, (-count, self._pair_key(changed), changed))
+            else:
+                del self.pair_counts[changed]
+                self.where.pop(changed, None)
+        self.merges.append(pair)
+        return deltas
+
+    # n_iter: merge할 횟수 (merge할 pair가 없으면 먼저 종료)
+    # callbacks: merge마다 TrainProgress를 받아서 호출할 함수들, True를 반환하면 학습 중단
+    # target_vocab_size: vocab 크기가 이 값에 도달하면 중단
+    # min_frequency: 가장 빈도가 높은 pair의 빈도가 이 값보다 작으면 중단
+    # checkpoint_path: 학습 상태를 저장할 파일, 학습이 끝날 때도 저장
+    # checkpoint_every: checkpoint_every merge마다 저장
+    # checkpoint_interval: 마지막 저장 후 checkpoint_interval초가 지나면 저장
+    # merge_batch_size: 주어지면 pair 빈도와 index를 유지하지 않고 round마다 vocab 전체를 한 번 훑어서
+    #                   최대 merge_batch_size개의 pair를 merge (merge_batch 참고, 결과는 같음)
+    # approximate_k: 주어지면 merge_batch_size 모드에서 전체 pair 빈도를 세지 않고 round마다
+    #                get_top_pairs로 상위 후보의 빈도만 정확히 셈 (메모리는 sketch 크기로 고정, 결과는 같음)
+    #                merge_batch_size가 없으면 approximate_k를 사용
+    # return: 학습된 merge 순서
+    def train(self, n_iter: int, callbacks: Optional[list[Callable]] = None,
+              target_vocab_size: Optional[int] = None, min_frequency: Optional[int] = None,
+              checkpoint_path: Optional[str] = None, checkpoint_every: Optional[int] = None,
+              checkpoint_interval: Optional[float] = None,
+              merge_batch_size: Optional[int] = None,
+              approximate_k: Optional[int] = None) -> list[tuple[str, str]]:
+        if approximate_k is not None and merge_batch_size is None:
+            merge_batch_size = approximate_k
+        if merge_batch_size is not None:
+            return self._train_batched(n_iter, merge_batch_size, callbacks, target_vocab_size, min_frequency,
+                                       checkpoint_path, checkpoint_every, checkpoint_interval, approximate_k)
+        start = last_checkpoint = time.perf_counter()
+        for _ in range(n_iter):
+            if target_vocab_size is not None and self.vocab_size() >= target_vocab_size:
+                break
+            best = self._best()
+            if best is None:
+                break
+            pair, frequency = best
+            if min_frequency is not None and frequency < min_frequency:
+                break
+            self.merge(pair)
+            if callbacks:
+                progress = TrainProgress(
+                    n_merges=len(self.merges),
+                    elapsed=time.perf_counter() - start,
+                    pair=pair,
+                    frequency=frequency,
+                    n_pairs=len(self.pair_counts),
+                    vocab_size=self.vocab_size(),
+                    memory_mb=peak_memory_mb(),
+                )
+                # 모든 callback을 호출한 뒤 하나라도 True를 반환했으면 중단
+                if any([callback(progress) for callback in callbacks]):
+                    break
+            if checkpoint_path is not None:
+                now = time.perf_counter()
+                if (checkpoint_every is not None and len(self.merges) % checkpoint_every == 0) or \
+                        (checkpoint_interval is not None and now - last_checkpoint >= checkpoint_interval):
+                    self.save_checkpoint(checkpoint_path)
+                    last_checkpoint = now
+        if checkpoint_path is not None:
+            self.save_checkpoint(checkpoint_path)
+        return self.merges
+
+    # train의 merge_batch_size 모드, 인자는 train 참고
+    # pair 빈도는 처음에 get_stats로 한 번 세고, round마다 merge_batch로 vocab을 한 번씩 훑음
+    # approximate_k가 주어지면 round마다 get_top_pairs로 빈도가 확정된 상위 pair만 셈
+    # 학습하는 동안 단어가 바뀌므로 BPETrainer의 pair index는 버리고 학습 후 필요할 때 다시 만듦
+    def _train_batched(self, n_iter: int, merge_batch_size: int, callbacks: Optional[list[Callable]],
+                       target_vocab_size: Optional[int], min_frequency: Optional[int],
+                       checkpoint_path: Optional[str], checkpoint_every: Optional[int],
+                       checkpoint_interval: Optional[float],
+                       approximate_k: Optional[int] = None) -> list[tuple[str, str]]:
+        start = last_checkpoint = time.perf_counter()
+        vocab = self.get_vocab()
+        self._drop_index()
+        pairs = get_stats(vocab) if approximate_k is None else None
+        cutoff = 0
+        k = approximate_k
+        if approximate_k is not None:
+            # sketch 칸 수는 기본값 (1 << 20)을 넘지 않고, 작은 vocab이면 pair 위치 수 정도로 줄임
+            n_positions = sum(len(ids) - 1 for ids in self.words)
+            width = min(1 << 20, 1 << max(10, n_positions.bit_length()))
+        n_merged = 0
+        stop = False
+        while n_merged < n_iter and not stop:
+            n = min(merge_batch_size, n_iter - n_merged)
+            # merge 하나로 vocab 크기는 최대 1 늘어나므로 target_vocab_size를 넘지 않는 만큼만 고름
+            if target_vocab_size is not None:
+                n = min(n, target_vocab_size - self.vocab_size())
+            if n <= 0:
+                break
+            if approximate_k is not None:
+                top = get_top_pairs(vocab, k, width=width)
+                if not top.counts:
+                    break
+                pairs, cutoff = top.exact(), top.cutoff
+                if not pairs:
+                    # 후보만으로 가장 빈도가 높은 pair를 확정할 수 없으면 후보를 늘려서 다시 셈
+                    k *= 2
+                    continue
+            elif not pairs:
+                break
+            batch, frequencies, n_pairs, new_vocab = merge_batch(pairs, vocab, n, min_frequency, cutoff)
+            if not batch:
+                break
+            for i, pair in enumerate(batch):
+                self._symbol_id(''.join(pair))
+                self.merges.append(pair)
+                n_merged += 1
+                if callbacks:
+                    progress = TrainProgress(
+                        n_merges=len(self.merges),
+                        elapsed=time.perf_counter() - start,
+                        pair=pair,
+                        frequency=frequencies[i],
+                        n_pairs=n_pairs[i],
+                        vocab_size=self.vocab_size(),
+                        memory_mb=peak_memory_mb(),
+                    )
+                    if any([callback(progress) for callback in callbacks]):
+                        # 중단한 merge까지만 vocab에 적용
+                        if i + 1 < len(batch):
+                            new_vocab = merge_pairs(batch[:i + 1], vocab)
+                        stop = True
+                        break
+            vocab = new_vocab
+            if checkpoint_path is not None:
+                now = time.perf_counter()
+                if (checkpoint_every is not None
+                        and len(self.merges) // checkpoint_every > (len(self.merges) - len(batch)) // checkpoint_every) or \
+                        (checkpoint_interval is not None and now - last_checkpoint >= checkpoint_interval):
+                    self._set_words(vocab)
+                    self.save_checkpoint(checkpoint_path)
+                    last_checkpoint = now
+        self._set_words(vocab)
+        if checkpoint_path is not None:
+            self.save_checkpoint(checkpoint_path)
+        return self.merges
+
+    # 단어와 빈도를 get_vocab 형식의 vocab으로 바꿈 (pair 빈도와 index는 갱신하지 않음)
+    def _set_words(self, vocab: dict[str, int]) -> None:
+        self.words = [array('I', map(self._symbol_id, word.split())) for word in vocab]
+        self.freqs = list(vocab.values())
+
+    # 지금까지의 merge와 merge된 vocab을 path에 저장
+    # 임시 파일에 쓴 뒤 교체해서 저장 중에 process가 죽어도 이전 checkpoint가 남음
+    def save_checkpoint(self, path: str) -> None:
+        lengths = array('I', map(len, self.words))
+        words = array('I')
+        for ids in self.words:
+            words.extend(ids)
+        state = {
+            'symbols': self.symbols,
+            'alphabet': sorted(self.alphabet),
+            'merges': self.merges,
+            'lengths': lengths,
+            'words': words,
+            'freqs': self.freqs,
+            'token_order': self.token_order,
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    # save_checkpoint로 저장한 상태에서 이어서 학습할 BPETrainer 생성
+    # pair 빈도와 heap은 단어들로부터 다시 만들므로 끊기지 않고 학습한 것과 같은 merge가 나옴
+    @classmethod
+    def from_checkpoint(cls, path: str) -> 'BPETrainer':
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        trainer = cls.__new__(cls)
+        trainer.symbols = state['symbols']
+        trainer.symbol_ids = {symbol: i for i, symbol in enumerate(trainer.symbols)}
+        trainer.alphabet = set(state['alphabet'])
+        trainer.merges = state['merges']
+        trainer.words = []
+        pos = 0
+        for length in state['lengths']:
+            trainer.words.append(state['words'][pos:pos + length])
+            pos += length
+        trainer.freqs = state['freqs']
+        trainer.token_order = state.get('token_order')
+        trainer._build_index()
+        return trainer
+
+    # 학습 중간이나 학습이 끝난 뒤에 새 단어 빈도를 더함
+    # 이미 있는 단어는 빈도만 늘리고, 새 단어는 지금까지의 merge를 적용해서 추가
+    # 바뀐 단어의 pair 빈도만 갱신하므로 이후 train은 전체를 다시 세지 않고 이어서 merge
+    # vocab: get_vocab 형식의 추가된 단어 빈도
+    def add_words(self, vocab: dict[str, int]) -> None:
+        self._ensure_index()
+        symbols = self.symbols
+        index = {''.join(symbols[i] for i in ids): idx for idx, ids in enumerate(self.words)}
+        ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        deltas = collections.defaultdict(int)
+        for word, freq in vocab.items():
+            chars = word.split()
+            idx = index.get(''.join(chars))
+            if idx is None:
+                self.alphabet.update(chars)
+                idx = len(self.words)
+                self.words.append(array('I', map(self._symbol_id, apply_merges(chars, ranks))))
+                self.freqs.append(0)
+            ids = self.words[idx]
+            self.freqs[idx] += freq
+            for pair in zip(ids, ids[1:]):
+                deltas[pair] += freq
+                self.where[pair].add(idx)
+        for changed, delta in deltas.items():
+            count = self.pair_counts[changed] + delta
+            self.pair_counts[changed] = count
+            heapq.heappush(self.heap, (-count, self._pair_key(changed), changed))
+
+    # return: 현재 merge 상태의 vocab ({띄어쓴 단어: 빈도})
+    def get_vocab(self) -> dict[str, int]:
+        symbols = self.symbols
+        return {' '.join(symbols[i] for i in ids): freq for ids, freq in zip(self.words, self.freqs)}
+
+    # 이미 merge된 vocab에서 이어서 학습할 BPETrainer 생성
+    # vocab: merges까지 적용된 get_vocab 형식의 vocab
+    # alphabet: 학습 전 기본 symbol, merges: 지금까지의 merge 순서
+    @classmethod
+    def from_vocab(cls, vocab: dict[str, int], alphabet: Iterable[str],
+                   merges: list[tuple[str, str]]) -> 'BPETrainer':
+        trainer = cls.__new__(cls)
+        trainer.symbols = []
+        trainer.symbol_ids = {}
+        # vocab_size가 처음부터 학습한 것과 같도록 merge로 만든 symbol도 모두 등록
+        for symbol in sorted(alphabet):
+            trainer._symbol_id(symbol)
+        for pair in merges:
+            trainer._symbol_id(''.join(pair))
+        trainer.alphabet = set(alphabet)
+        trainer.merges = list(merges)
+        trainer.token_order = None
+        trainer._set_words(vocab)
+        trainer._build_index()
+        return trainer
+
+
+# ShardedBPETrainer의 worker process
+# 단어 일부 (shard)로 BPETrainer를 만들고 coordinator의 명령을 pipe로 받아서 처리
+def _shard_worker(conn, vocab: dict[str, int], alphabet: list[str], merges: list[tuple[str, str]]) -> None:
+    trainer = BPETrainer.from_vocab(vocab, alphabet, merges)
+    del vocab
+    # 지난 round에 빈도 변화를 계산한 후보
+    candidates = []
+    while True:
+        command, *args = conn.recv()
+        if command == 'counts':
+            conn.send(trainer.string_pair_counts())
+        elif command == 'step':
+            # 지난 round 후보 중 확정된 앞의 n_commit개를 merge하고 이번 round 후보의 빈도 변화를 계산
+            # 첫 후보는 항상 확정되므로 받자마자 merge하고 나머지만 merge 없이 빈도 변화를 계산
+            n_commit, next_candidates = args
+            for pair in candidates[1:n_commit]:
+                trainer.merge(pair)
+            candidates = next_candidates
+            changes = {}
+            if candidates:
+                deltas = trainer.merge(candidates[0])
+                changes[1] = {trainer._pair_key(pair): delta for pair, delta in deltas.items() if delta}
+                for t, changed in trainer.batch_changes(candidates[1:]).items():
+                    changes[t + 1] = changed
+            conn.send(changes)
+        elif command == 'cpu':
+            conn.send(time.process_time())
+        elif command == 'vocab':
+            conn.send(trainer.get_vocab())
+        elif command == 'close':
+            conn.close()
+            return
+
+
+class ShardedBPETrainer:
+    # 단어를 num_shards개의 process에 나눠서 각 process가 BPETrainer로 자기 단어를 merge
+    # coordinator (현재 process)는 전체 pair 빈도와 heap만 유지하고 단어는 갖지 않음
+    # round마다 모든 shard와 pipe 왕복 한 번 ('step')
+    #   1. coordinator가 전체 빈도로 상위 후보를 골라서 보냄
+    #   2. shard는 지난 round에 확정된 merge를 적용하고, 후보를 차례로 merge할 때의 빈도 변화를 계산해서 보냄
+    #      (첫 후보는 항상 확정되므로 바로 merge)
+    #   3. coordinator가 빈도 변화를 합쳐서 _accept_batch로 한 번에 하나씩 merge할 때와 같은 순서가 확정되는
+    #      후보까지 merge로 확정하고 전체 pair 빈도에 반영 -> BPETrainer와 같은 merge
+    # 단어를 훑는 일 (빈도 변화 계산, merge)은 shard에서 나눠서 하고 coordinator는 바뀐 pair만 처리
+    # shard는 확정되지 않을 후보도 계산하므로 전체 CPU 시간은 BPETrainer보다 많음
+    # core가 num_shards + 1개보다 적으면 BPETrainer보다 느림 (benchmark.py의 sharded 참고)
+    # vocab: get_vocab 형식의 vocab (alphabet, merges가 주어지면 merges까지 적용된 vocab)
+    def __init__(self, vocab: dict[str, int], num_shards: int, alphabet: Optional[Iterable[str]] = None,
+                 merges: Optional[list[tuple[str, str]]] = None) -> None:
+        if alphabet is None:
+            alphabet = {symbol for word in vocab for symbol in word.split()}
+        self.alphabet = set(alphabet)
+        self.merges = list(merges or [])
+        # vocab_size 계산용 symbol 집합 (BPETrainer.symbols와 같음)
+        self.symbols = self.alphabet | {''.join(pair) for pair in self.merges}
+        shards = [{} for _ in range(num_shards)]
+        for i, (word, freq) in enumerate(vocab.items()):
+            shards[i % num_shards][word] = freq
+        self.conns = []
+        self.processes = []
+        for shard in shards:
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_worker, daemon=True,
+                                              args=(child_conn, shard, sorted(self.alphabet), self.merges))
+            process.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        # 전체 pair 빈도 (symbol 문자열 pair, 빈도가 0이 되면 지움)와 (-빈도, pair)의 heap (오래된 항목은 꺼낼 때 버림)
+        self.pair_counts = collections.defaultdict(int)
+        for counts in self._call('counts'):
+            for pair, count in counts.items():
+                self.pair_counts[pair] += count
+        self.heap = [(-count, pair) for pair, count in self.pair_counts.items()]
+        heapq.heapify(self.heap)
+        # 지금까지의 round 수 (benchmark용)
+        self.n_rounds = 0
+
+    # 모든 shard에 같은 명령을 보내고 결과를 shard 순서대로 받음
+    def _call(self, *message) -> list:
+        for conn in self.conns:
+            conn.send(message)
+        return [conn.recv() for conn in self.conns]
+
+    # return: 빈도가 높은 pair 최대 n개, get_best_pair와 같은 순서
+    def _top(self, n: int) -> list[tuple[str, str]]:
+        top = []
+        popped = []
+        while self.heap and len(top) < n:
+            entry = heapq.heappop(self.heap)
+            neg_count, pair = entry
+            # 오래된 항목과 같은 pair의 중복 항목은 버림
+            if self.pair_counts.get(pair) != -neg_count or pair in top:
+                continue
+            popped.append(entry)
+            top.append(pair)
+        for entry in popped:
+            heapq.heappush(self.heap, entry)
+        return top
+
+    def vocab_size(self) -> int:
+        return len(self.symbols) + 2
+
+    # n_iter, callbacks, target_vocab_size, min_frequency: BPETrainer.train 참고
+    # merge_batch_size: round마다 보낼 최대 후보 수
+    #                   학습 초반처럼 merge로 생긴 pair가 다음 후보를 앞지르기 쉬우면 확정되는 pair가 적으므로
+    #                   다음 round의 후보 수는 이번 round에 확정된 pair 수의 2배 (1 ~ merge_batch_size)
+    # return: 학습된 merge 순서
+    def train(self, n_iter: int, callbacks: Optional[list[Callable]] = None,
+              target_vocab_size: Optional[int] = None, min_frequency: Optional[int] = None,
+              merge_batch_size: int = 32) -> list[tuple[str, str]]:
+        start = time.perf_counter()
+        n_merged = 0
+        batch_size = 1
+        # 지난 round 후보 중 확정되어서 shard에 merge하라고 보낼 수
+        n_commit = 0
+        while n_merged < n_iter:
+            n = min(batch_size, n_iter - n_merged)
+            # merge 하나로 vocab 크기는 최대 1 늘어나므로 target_vocab_size를 넘지 않는 만큼만 고름
+            if target_vocab_size is not None:
+                n = min(n, target_vocab_size - self.vocab_size())
+            if n <= 0:
+                break
+            candidates = self._top(n)
+            if min_frequency is not None:
+                candidates = [pair for pair in candidates if self.pair_counts[pair] >= min_frequency]
+            if not candidates:
+                break
+            changes = collections.defaultdict(lambda: collections.defaultdict(int))
+            for shard_changes in self._call('step', n_commit, candidates):
+                for t, changed in shard_changes.items():
+                    for pair, change in changed.items():
+                        changes[t][pair] += change
+            n_commit = 0
+            self.n_rounds += 1
+            n_accepted, frequencies, sizes = _accept_batch(self.pair_counts, candidates, changes, min_frequency, 0)
+            batch = candidates[:n_accepted]
+            batch_size = min(merge_batch_size, 2 * n_accepted)
+            stop = False
+            for i, pair in enumerate(batch):
+                self.symbols.add(pair[0] + pair[1])
+                self.merges.append(pair)
+                if callbacks:
+                    progress = TrainProgress(
+                        n_merges=len(self.merges),
+                        elapsed=time.perf_counter() - start,
+                        pair=pair,
+                        frequency=frequencies[i],
+                        n_pairs=sizes[i],
+                        vocab_size=self.vocab_size(),
+                        memory_mb=peak_memory_mb(),
+                    )
+                    if any([callback(progress) for callback in callbacks]):
+                        # 중단한 merge까지만 확정
+                        batch = batch[:i + 1]
+                        stop = True
+                        break
+            # 확정된 merge의 빈도 변화를 전체 pair 빈도에 반영 (shard에는 다음 step에서 보냄)
+            for t in range(1, len(batch) + 1):
+                for pair, change in changes[t].items():
+                    count = self.pair_counts[pair] + change
+                    if count > 0:
+                        self.pair_counts[pair] = count
+                        heapq.heappush(self.heap, (-count, pair))
+                    else:
+                        del self.pair_counts[pair]
+            n_commit = len(batch)
+            n_merged += len(batch)
+            if stop:
+                break
+        # 마지막 round에 확정된 merge를 shard에 적용 (첫 후보는 이미 적용됨)
+        if n_commit > 1:
+            self._call('step', n_commit, [])
+        return self.merges
+
+    # return: (현재 process, shard process들)이 지금까지 쓴 CPU 시간 (초) (benchmark용)
+    def cpu_times(self) -> tuple[float, list[float]]:
+        return time.process_time(), self._call('cpu')
+
+    # return: 모든 shard의 단어를 모은 현재 merge 상태의 vocab
+    def get_vocab(self) -> dict[str, int]:
+        vocab = {}
+        for shard in self._call('vocab'):
+            vocab.update(shard)
+        return vocab
+
+    # return: 같은 상태의 (한 process) BPETrainer, 학습이 끝난 뒤 이어서 학습할 때 사용
+    def to_trainer(self) -> BPETrainer:
+        return BPETrainer.from_vocab(self.get_vocab(), self.alphabet, self.merges)
+
+    # worker process 종료
+    def close(self) -> None:
+        for conn in self.conns:
+            conn.send(('close',))
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.conns = []
+        self.processes = []
+
+    def __enter__(self) -> 'ShardedBPETrainer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class BaseTokenizer(abc.ABC):
+    # BPETokenizer, WordTokenizer가 공유하는 부분
+    # 자식 클래스는 train, _encode(문장 하나 -> id list), 저장/불러오기에 쓰는 _get_state, _set_state, _attach와
+    # decode에 쓰는 _decode_piece, _join_pieces를 구현 (하나라도 빠지면 객체를 만들 수 없음)
+    # kind: 저장 파일에 기록하는 tokenizer 종류
+    kind = None
 
-class BPETokenizer:
     # corpus: 학습에 사용할 말뭉치
     # vocab: 학습된 vocab
-    def __init__(self, corpus: Optional[Union[list[str], str]] = None) -> None:
-        if isinstance(corpus, list):
-            self.corpus = corpus
-        else:
-            self.corpus = [corpus]
+    # keep_corpus: False이면 corpus를 저장하지 않고 바로 단어 빈도만 세서 보관
+    #              (메모리 사용량이 corpus 크기가 아니라 단어 종류 수에 비례)
+    # pre_tokenizer: 학습과 토큰화에서 문장을 단어로 나누는 PreTokenizer, None이면 띄어쓰기 단위
+    #                저장 파일에는 기록하지 않으므로 load, attach할 때 같은 설정을 넘김
+    # num_workers: keep_corpus가 False일 때 corpus의 단어 빈도를 셀 process 수 (count_words 참고)
+    def __init__(self, corpus: Optional[Union[list[str], str]] = None, keep_corpus: bool = True,
+                 pre_tokenizer: Optional[PreTokenizer] = None, num_workers: int = 1) -> None:
+        self.pre_tokenizer = pre_tokenizer if pre_tokenizer is not None else PreTokenizer()
+        if corpus is None:
+            corpus = []
+        elif not isinstance(corpus, list):
+            corpus = [corpus]
+        self.keep_corpus = keep_corpus
+        # 생성자에 넘긴 list를 바꾸지 않도록 한 번만 복사하고 이후에는 extend
+        self.corpus = list(corpus) if keep_corpus else []
         self.vocab = None
+        # 아직 학습에 반영되지 않은 단어 빈도
+        # (keep_corpus가 False일 때 추가된 corpus, 학습이 끝난 뒤 add_corpus로 추가된 corpus)
+        self.pending = (count_words(corpus, num_workers, self.pre_tokenizer) if not keep_corpus
+                        else collections.Counter())
+        # (decode table을 만든 vocab, id -> 문자열 배열), decode할 때 만들고 vocab이 바뀌면 다시 만듦
+        self._decode_table = None
+        # start_pool로 띄운 (토큰화 pool, process 수, 띄울 때의 vocab, vocab 크기)
+        self._pool = None
         
     # text: 토큰화할 문장
     # padding: True일 경우 padding
     # max_length: 최대 길이
+    # num_workers, chunk_size: tokenize 참고
     # return: 토큰화된 문장
-    def __call__(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None) -> Union[list[list[int]], list[int]]:
-        return self.tokenize(text, padding, max_length)
+    def __call__(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None,
+                 num_workers: int = 1, chunk_size: int = CHUNK_SIZE) -> Union[list[list[int]], list[int]]:
+        return self.tokenize(text, padding, max_length, num_workers, chunk_size)
     
     # self.corpus에 corpus 추가
-    def add_corpus(self, corpus: Union[list[str], str]) -> None:
-        if isinstance(corpus, list):
-            self.corpus += corpus
-        else:
-            self.corpus += [corpus]
+    # 이미 학습된 경우나 keep_corpus가 False인 경우 추가된 corpus의 단어 빈도를 바로 셈
+    # (학습된 경우 다음 train에서 추가된 부분만 학습)
+    # num_workers: 단어 빈도를 셀 process 수 (count_words 참고)
+    def add_corpus(self, corpus: Union[list[str], str], num_workers: int = 1) -> None:
+        if not isinstance(corpus, list):
+            corpus = [corpus]
+        if self.keep_corpus:
+            self.corpus.extend(corpus)
+        if self.vocab is not None or not self.keep_corpus:
+            self.pending.update(count_words(corpus, num_workers, self.pre_tokenizer))
+
+    # 미리 세어 둔 단어 빈도를 corpus 대신 추가 (다음 train에서 학습)
+    # counts: {단어: 빈도}, count_words나 read_counts_file의 결과
+    def add_word_counts(self, counts: dict[str, int]) -> None:
+        self.pending.update(counts)
+
+    # 아직 학습에 반영되지 않은 단어 빈도 (train에 corpus가 주어지면 그것도 포함)를 꺼냄
+    def _take_pending(self, corpus: Optional[Iterable[str]], num_workers: int) -> collections.Counter:
+        delta = self.pending
+        if corpus is not None:
+            delta.update(count_words(corpus, num_workers, self.pre_tokenizer))
+        self.pending = collections.Counter()
+        return delta
+
+    # 토큰화에는 필요 없는 학습용 상태를 비움 (병렬 토큰화 worker에 보낼 때 사용)
+    def _drop_training_state(self) -> None:
+        self.corpus = []
+        self.pending = collections.Counter()
+
+    # return: 토큰화 worker에 보낼 복사본 (학습용 상태와 decode table은 빼고 보냄)
+    def _worker_copy(self) -> 'BaseTokenizer':
+        tokenizer = copy.copy(self)
+        tokenizer._drop_training_state()
+        tokenizer._decode_table = None
+        return tokenizer
+
+    # pool은 pickle할 수 없으므로 빼고 보냄 (copy.copy도 같음)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    # num_workers개의 토큰화 process를 띄워 두고 close_pool 전까지 tokenize, encode_batch, iter_batches,
+    # encode_to_file에서 재사용 (tokenizer는 pool을 띄울 때 한 번만 worker에 보냄)
+    # with tokenizer.start_pool(4): ... 처럼 쓰면 with가 끝날 때 close_pool
+    def start_pool(self, num_workers: int) -> 'BaseTokenizer':
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        self.close_pool()
+        pool = multiprocessing.Pool(num_workers, initializer=_init_encode_worker, initargs=(self._worker_copy(),))
+        self._pool = (pool, num_workers, self.vocab, len(self.vocab))
+        return self
+
+    def close_pool(self) -> None:
+        if self._pool is not None:
+            pool = self._pool[0]
+            self._pool = None
+            pool.close()
+            pool.join()
+
+    def __enter__(self) -> 'BaseTokenizer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close_pool()
+
+    # return: 토큰화에 쓸 (pool, process 수)
+    # start_pool로 띄운 pool이 있으면 재사용하고 (그 사이 학습으로 vocab이 바뀌었으면 다시 띄움),
+    # 없으면 num_workers개의 process로 이번 호출에만 쓸 pool을 띄움
+    @contextlib.contextmanager
+    def _encode_pool(self, num_workers: int):
+        if self._pool is not None:
+            _, pool_workers, vocab, size = self._pool
+            if vocab is not self.vocab or size != len(self.vocab):
+                self.start_pool(pool_workers)
+            yield self._pool[0], self._pool[1]
+            return
+        with multiprocessing.Pool(num_workers, initializer=_init_encode_worker,
+                                  initargs=(self._worker_copy(),)) as pool:
+            yield pool, num_workers
+
+    @abc.abstractmethod
+    def train(self, n_iter: Optional[int] = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def _encode(self, sentence: str) -> list[int]:
+        ...
+
+    # return: (토큰 list, 토큰별 vocab 값, 토큰 index pair로 된 merge list)
+    @abc.abstractmethod
+    def _get_state(self):
+        ...
+
+    @abc.abstractmethod
+    def _set_state(self, tokens: list[str], ids: list[int], merges: list[tuple[int, int]]) -> None:
+        ...
+
+    # 학습된 vocab (와 merge)를 path에 binary로 저장
+    def save(self, path: str) -> None:
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        write_tokenizer_file(path, self.kind, *self._get_state())
+
+    # save로 저장한 파일을 mmap으로 읽어서 학습된 tokenizer 생성
+    # kwargs: 생성자에 넘길 인자 (corpus 제외)
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'BaseTokenizer':
+        saved = read_tokenizer_file(path)
+        if saved.kind != cls.kind:
+            raise ValueError(f"{path} is a {saved.kind} tokenizer, not {cls.kind}")
+        tokenizer = cls(**kwargs)
+        tokenizer._set_state(saved.tokens, saved.ids, saved.merges)
+        return tokenizer
     
-    # n_iter: merge할 횟수
-    def train(self, n_iter: int) -> None:
-        vocab = get_vocab(self.corpus)
-        # n_iter만큼 merge
-        for i in range(n_iter):
-            pairs = get_stats(vocab)
-            num_merged, vocab = merge_n_best(pairs, vocab, n_iter)
-            # merge한 갯수를 i에 더해줌
-            i += num_merged
-        self.vocab = vocab
-        
+    # save로 저장한 파일을 mmap으로 열어서 vocab (와 merge)를 dict로 복사하지 않고 파일에서 바로 찾는 tokenizer 생성
+    # data loader worker 등 여러 process에서 같은 파일을 attach하면 vocab 메모리를 공유하고 시작 비용이 거의 없음
+    # attach한 tokenizer를 pickle하면 파일 경로만 넘어감
+    # kwargs: 생성자에 넘길 인자 (corpus 제외)
+    @classmethod
+    def attach(cls, path: str, **kwargs) -> 'BaseTokenizer':
+        mapped = MappedTokenizerFile(path)
+        if mapped.kind != cls.kind:
+            raise ValueError(f"{path} is a {mapped.kind} tokenizer, not {cls.kind}")
+        tokenizer = cls(**kwargs)
+        tokenizer._attach(mapped)
+        return tokenizer
+
+    @abc.abstractmethod
+    def _attach(self, mapped: MappedTokenizerFile) -> None:
+        ...
+
     # text: 토큰화할 문장
     # padding: True일 경우 padding
     # max_length: 최대 길이
+    # num_workers: 여러 문장이 들어올 경우 토큰화할 process 수 (start_pool로 띄운 pool이 있으면 그 pool 사용)
+    # chunk_size: process 하나에 한 번에 넘길 문장 수
     # return: 토큰화된 문장
-    def tokenize(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None) -> Union[list[list[int]], list[int]]: 
+    def tokenize(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None,
+                 num_workers: int = 1, chunk_size: int = CHUNK_SIZE) -> Union[list[list[int]], list[int]]: 
         if self.vocab is None:
             raise ValueError("Train tokenizer first!")
         tokens = []
         # 여러 문장이 들어올 경우
         if isinstance(text, list):
-            # 각 문장을 띄어쓰기 단위로 split
-            for sentence in text:
-                tokenized_words = []
-                for word in sentence.split():
-                    if word in self.vocab:
-                        tokenized_words.append(self.vocab[word])
-                    else:
-                        tokenized_words.append(self.vocab['<unk>'])
-                tokens.append(tokenized_words)
+            # 각 문장을 pre_tokenizer로 단어로 나눠서 토큰화 (num_workers > 1이거나 pool이 있으면 여러 process로)
+            tokens = self._encode_all(text, num_workers, chunk_size)
             # max_length가 지정되어 있으면 max_length만큼 자르기
             if max_length is not None:
                 for i in range(len(tokens)):
@@ -118,18 +1187,157 @@ class BPETokenizer:
                 
         # 한 문장이 들어올 경우
         else:
-            # 띄어쓰기 단위로 split
-            for word in text.split():
-                if word in self.vocab:
-                    tokens.append(self.vocab[word])
-                else:
-                    tokens.append(self.vocab['<unk>'])
+            tokens = self._encode(text)
             # max_length가 지정되어 있으면 max_length만큼 자르기
             if max_length is not None and len(tokens) > max_length:
                 tokens = tokens[:max_length]
 
         return tokens
 
+    # text: 토큰화할 문장들
+    # max_length: 최대 길이
+    # num_workers, chunk_size: tokenize 참고
+    # return: input_ids (pad = 0), attention_mask, lengths를 담은 dict
+    #         input_ids, attention_mask는 (문장 수, 가장 긴 문장 길이)의 int32 행렬
+    def encode_batch(self, text: list[str], max_length: Optional[int] = None,
+                     num_workers: int = 1, chunk_size: int = CHUNK_SIZE) -> dict[str, np.ndarray]:
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        encoded = self._encode_all(text, num_workers, chunk_size)
+        lengths = self._lengths(encoded, max_length)
+        return self._pad_batch(encoded, lengths)
+
+    # 길이가 비슷한 문장끼리 묶어서 padding을 줄인 batch를 차례로 반환
+    # text: 토큰화할 문장들
+    # max_tokens: batch 하나의 padding 포함 토큰 수 (문장 수 * 가장 긴 문장 길이) 상한
+    #             이보다 긴 문장 하나는 혼자 batch가 됨
+    # max_batch_size: batch 하나의 최대 문장 수
+    # max_length, num_workers, chunk_size: encode_batch 참고
+    # return: encode_batch와 같은 dict에 text 안에서의 원래 위치 indices를 더한 batch들
+    #         짧은 문장부터 나오므로 원래 순서가 필요하면 indices로 되돌림
+    def iter_batches(self, text: list[str], max_tokens: int, max_batch_size: Optional[int] = None,
+                     max_length: Optional[int] = None, num_workers: int = 1,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[dict[str, np.ndarray]]:
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        encoded = self._encode_all(text, num_workers, chunk_size)
+        lengths = self._lengths(encoded, max_length)
+        # 길이 순으로 정렬 (길이가 같으면 원래 순서), 정렬된 순서대로 끊으면 batch의 마지막 문장이 가장 김
+        order = np.argsort(lengths, kind='stable')
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while end < len(order) and (max_batch_size is None or end - start < max_batch_size) \
+                    and (end - start + 1) * int(lengths[order[end]]) <= max_tokens:
+                end += 1
+            indices = order[start:end]
+            batch = self._pad_batch([encoded[i] for i in indices], lengths[indices])
+            batch["indices"] = indices
+            yield batch
+            start = end
+
+    # return: 각 문장의 토큰 수 (max_length로 자른 길이), int32 배열
+    @staticmethod
+    def _lengths(encoded: list[list[int]], max_length: Optional[int]) -> np.ndarray:
+        lengths = np.fromiter(map(len, encoded), dtype=np.int32, count=len(encoded))
+        if max_length is not None:
+            np.minimum(lengths, max_length, out=lengths)
+        return lengths
+
+    # encoded를 lengths 길이로 자르고 가장 긴 문장에 맞춰 padding한 input_ids, attention_mask, lengths
+    @staticmethod
+    def _pad_batch(encoded: list[list[int]], lengths: np.ndarray) -> dict[str, np.ndarray]:
+        width = int(lengths.max()) if len(encoded) > 0 else 0
+        # padding까지 한 번에 채울 행렬을 미리 할당
+        input_ids = np.zeros((len(encoded), width), dtype=np.int32)
+        for row, (ids, length) in enumerate(zip(encoded, lengths)):
+            input_ids[row, :length] = ids[:length]
+        attention_mask = (np.arange(width, dtype=np.int32) < lengths[:, None]).astype(np.int32)
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "lengths": lengths}
+
+    # 문장들을 순서대로 토큰화, num_workers > 1이거나 start_pool로 띄운 pool이 있으면
+    # chunk_size 문장씩 process pool에 나눠서 처리
+    def _encode_all(self, text: list[str], num_workers: int = 1, chunk_size: int = CHUNK_SIZE) -> list[list[int]]:
+        if num_workers <= 1 and self._pool is None:
+            return [self._encode(sentence) for sentence in text]
+        encoded = []
+        with self._encode_pool(num_workers) as (pool, _):
+            for chunk in pool.imap(_encode_chunk, _split_chunks(text, chunk_size)):
+                encoded.extend(chunk)
+        return encoded
+
+    # corpus를 chunk_size 문서씩 토큰화하면서 path에 토큰 id를 이어서 씀 (storage.TokenFileWriter 형식)
+    # 전체를 메모리에 올리지 않으므로 corpus는 generator 등 한 번만 읽을 수 있는 iterable도 가능
+    # max_length: 문서마다 이 길이까지만 저장
+    # num_workers: 토큰화할 process 수, 한 번에 최대 2 * num_workers개의 chunk만 처리 중
+    #              (start_pool로 띄운 pool이 있으면 그 pool 사용)
+    # return: 쓴 파일을 np.memmap으로 연 TokenFile
+    def encode_to_file(self, corpus: Iterable[str], path: str, max_length: Optional[int] = None,
+                       num_workers: int = 1, chunk_size: int = CHUNK_SIZE) -> TokenFile:
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        with TokenFileWriter(path, len(self.vocab)) as writer:
+            for encoded in self._iter_encoded(corpus, num_workers, chunk_size):
+                if max_length is not None:
+                    encoded = [ids[:max_length] for ids in encoded]
+                writer.write(encoded)
+        return TokenFile(path)
+
+    # corpus를 chunk_size 문장씩 순서대로 토큰화한 결과를 chunk 단위로 yield
+    def _iter_encoded(self, corpus: Iterable[str], num_workers: int = 1,
+                      chunk_size: int = CHUNK_SIZE) -> Iterator[list[list[int]]]:
+        if num_workers <= 1 and self._pool is None:
+            for chunk in _split_chunks(corpus, chunk_size):
+                yield [self._encode(sentence) for sentence in chunk]
+            return
+        with self._encode_pool(num_workers) as (pool, num_workers):
+            # pool.imap은 corpus를 끝까지 미리 읽으므로 일정 개수의 chunk만 넘김 (count_words와 같음)
+            pending = collections.deque()
+            for chunk in _split_chunks(corpus, chunk_size):
+                pending.append(pool.apply_async(_encode_chunk, (chunk,)))
+                if len(pending) >= 2 * num_workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    # ids: 토큰 id (list나 1차원 배열), pad는 건너뜀
+    # return: 토큰을 이어 붙인 문장
+    def decode(self, ids: Union[list[int], np.ndarray]) -> str:
+        table = self._get_decode_table()
+        return self._join_pieces(_lookup_pieces(table, ids).tolist())
+
+    # batch: 토큰 id list들이나 encode_batch의 input_ids 같은 2차원 배열
+    # return: 문장마다 decode한 결과
+    def batch_decode(self, batch: Union[list[list[int]], np.ndarray]) -> list[str]:
+        table = self._get_decode_table()
+        if isinstance(batch, np.ndarray) and batch.ndim == 2:
+            # 행렬 전체를 한 번에 문자열로 바꾸고 문장마다 이어 붙임
+            return [self._join_pieces(row) for row in _lookup_pieces(table, batch).tolist()]
+        return [self._join_pieces(_lookup_pieces(table, ids).tolist()) for ids in batch]
+
+    # return: id -> decode할 때 이어 붙일 문자열 (_decode_piece) 배열, pad는 빈 문자열
+    def _get_decode_table(self) -> np.ndarray:
+        if self.vocab is None:
+            raise ValueError("Train tokenizer first!")
+        # 이어서 학습하면 vocab이 새 dict가 되거나 (BPE) 토큰이 뒤에 추가됨 (Word)
+        if self._decode_table is None or self._decode_table[0] is not self.vocab \
+                or len(self._decode_table[1]) != len(self.vocab):
+            table = np.empty(len(self.vocab), dtype=object)
+            for token, i in self.vocab.items():
+                table[i] = self._decode_piece(token)
+            table[self.vocab[PAD]] = ''
+            self._decode_table = (self.vocab, table)
+        return self._decode_table[1]
+
+    @abc.abstractmethod
+    def _decode_piece(self, token: str) -> str:
+        ...
+
+    # pieces: 토큰별 문자열, return: str.join 한 번으로 이어 붙이고 앞뒤 띄어쓰기만 정리한 문장
+    @abc.abstractmethod
+    def _join_pieces(self, pieces: list[str]) -> str:
+        ...
+
     def _padding(self, tokens):
         # 가장 긴 문장의 길이를 구함
         max_len = max(len(sentence) for sentence in tokens)
@@ -140,80 +1348,350 @@ class BPETokenizer:
             padded_tokens.append(sentence + padding)
             
         return padded_tokens
-    
-    
-class WordTokenizer:
+
+
+class BPETokenizer(BaseTokenizer):
+    kind = 'bpe'
+
     # corpus: 학습에 사용할 말뭉치
     # vocab: 학습된 vocab
-    def __init__(self, corpus: Optional[Union[list[str], str]] = None) -> None:
-        if isinstance(corpus, list):
-            self.corpus = corpus
-        else:
-            self.corpus = [corpus]
-        self.vocab = None
-        
-    # text: 토큰화할 문장
-    # padding: True일 경우 padding
-    # max_length: 최대 길이
-    # return: 토큰화된 문장
-    def __call__(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None) -> Union[list[list[int]], list[int]]:
-        return self.tokenize(text, padding, max_length)
+    # merges: 학습된 merge 순서
+    # cache_size: 단어별 토큰화 결과를 저장할 LRU cache 크기
+    # keep_corpus, pre_tokenizer, num_workers: BaseTokenizer 참고
+    def __init__(self, corpus: Optional[Union[list[str], str]] = None, cache_size: int = 100000,
+                 keep_corpus: bool = True, pre_tokenizer: Optional[PreTokenizer] = None,
+                 num_workers: int = 1) -> None:
+        super().__init__(corpus, keep_corpus, pre_tokenizer, num_workers)
+        self.merges = None
+        self.ranks = None
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        # 학습에 사용한 BPETrainer, 학습 후 추가된 corpus를 이어서 학습할 때 사용
+        self.trainer = None
     
-    # self.corpus에 corpus 추가    
-    def add_corpus(self, corpus: Union[list[str], str]) -> None:
-        if isinstance(corpus, list):
-            self.corpus += corpus
+    # n_iter: merge할 횟수 (이미 학습된 merge 포함)
+    # num_workers: corpus의 단어 빈도를 셀 process 수
+    # corpus: 주어지면 self.corpus 대신 학습에 사용 (generator 등 한 번만 읽을 수 있는 iterable도 가능)
+    # callbacks, target_vocab_size, min_frequency, checkpoint_*, merge_batch_size, approximate_k: BPETrainer.train 참고
+    # resume_from: 주어지면 corpus 대신 이 checkpoint에서 이어서 학습
+    # num_shards: 주어지면 단어를 num_shards개의 process에 나눠서 학습 (ShardedBPETrainer, 결과는 같음)
+    #             merge_batch_size가 주어지면 ShardedBPETrainer의 round마다 merge할 최대 pair 수로 사용
+    # 이미 학습된 tokenizer면 add_corpus나 corpus로 추가된 단어만 pair 빈도에 더하고 이어서 merge
+    # (기존 토큰의 id는 유지)
+    # load, attach한 tokenizer는 pair 빈도가 없으므로 resume_from 없이 이어서 학습할 수 없음
+    def train(self, n_iter: int, num_workers: int = 1, corpus: Optional[Iterable[str]] = None,
+              callbacks: Optional[list[Callable]] = None, target_vocab_size: Optional[int] = None,
+              min_frequency: Optional[int] = None, checkpoint_path: Optional[str] = None,
+              checkpoint_every: Optional[int] = None, checkpoint_interval: Optional[float] = None,
+              resume_from: Optional[str] = None, merge_batch_size: Optional[int] = None,
+              num_shards: Optional[int] = None, approximate_k: Optional[int] = None) -> None:
+        if resume_from is None and self.trainer is None and self.vocab is not None:
+            raise ValueError("Tokenizer has no training state to continue from (loaded or attached); "
+                             "use resume_from with a checkpoint or train a new tokenizer")
+        sharded = num_shards is not None and num_shards > 1
+        if sharded and (checkpoint_path is not None or approximate_k is not None):
+            raise ValueError("num_shards cannot be combined with checkpoint_path or approximate_k")
+        if resume_from is not None:
+            trainer = BPETrainer.from_checkpoint(resume_from)
+        elif self.trainer is not None:
+            trainer = self.trainer
+            trainer.add_words(split_words(self._take_pending(corpus, num_workers)))
+            # 기존 토큰의 id를 유지 (checkpoint에도 저장)
+            trainer.token_order = list(self.vocab)
         else:
-            self.corpus += [corpus]
-    
-    # vocab 생성
-    def train(self, n_iter: Optional[int] = None) -> None:
-        self.vocab = collections.defaultdict(int)
-        # corpus를 띄어쓰기 단위로 split
-        for sentence in self.corpus:
-            for word in sentence.split():
-                self.vocab[word] += 1
-
-    # text: 토큰화할 문장
-    # padding: True일 경우 padding
-    # max_length: 최대 길이
-    # return: 토큰화된 문장
-    def tokenize(self, text: Union[list[str], str], padding: bool = False, max_length: Optional[int] = None) -> Union[list[list[int]], list[int]]: 
-        if self.vocab is None:
-            raise ValueError("Train tokenizer first!")
-        tokens = []
-        if isinstance(text, list):
-            for sentence in text:
-                tokenized_words = []
-                for word in sentence.split():
-                    if word in self.vocab:
-                        tokenized_words.append(self.vocab[word])
-                    else:
-                        tokenized_words.append(self.vocab['<unk>'])
-                tokens.append(tokenized_words)
-            if max_length is not None:
-                for i in range(len(tokens)):
-                    if len(tokens[i]) > max_length:
-                        tokens[i] = tokens[i][:max_length]
-            if padding:
-                tokens = self._padding(tokens)
+            if corpus is None:
+                corpus = self.corpus
+            vocab = split_words(self._take_pending(corpus, num_workers))
+            # 여러 process로 나눠서 학습할 때는 현재 process에서 pair 빈도를 세지 않음
+            trainer = ShardedBPETrainer(vocab, num_shards) if sharded else BPETrainer(vocab)
+        token_order = trainer.token_order if isinstance(trainer, BPETrainer) else None
+        if sharded:
+            if isinstance(trainer, BPETrainer):
+                trainer = ShardedBPETrainer(trainer.get_vocab(), num_shards, trainer.alphabet, trainer.merges)
+            with trainer:
+                shard_kwargs = {"merge_batch_size": merge_batch_size} if merge_batch_size is not None else {}
+                trainer.train(n_iter - len(trainer.merges), callbacks, target_vocab_size, min_frequency,
+                              **shard_kwargs)
+                trainer = trainer.to_trainer()
+            trainer.token_order = token_order
+            merges = trainer.merges
         else:
-            for word in text.split():
-                if word in self.vocab:
-                    tokens.append(self.vocab[word])
-                else:
-                    tokens.append(self.vocab['<unk>'])
-            if max_length is not None and len(tokens) > max_length:
-                tokens = tokens[:max_length]
+            # n_iter만큼 merge
+            merges = trainer.train(n_iter - len(trainer.merges), callbacks, target_vocab_size, min_frequency,
+                                   checkpoint_path, checkpoint_every, checkpoint_interval, merge_batch_size,
+                                   approximate_k)
+        vocab = build_bpe_vocab(trainer.alphabet, merges, token_order)
+        self.trainer = trainer
+        self._set_merges(vocab, merges)
 
-        return tokens
-    
-    def _padding(self, tokens):
-        max_len = max(len(sentence) for sentence in tokens)
+    def _drop_training_state(self) -> None:
+        super()._drop_training_state()
+        self.trainer = None
 
-        padded_tokens = []
-        for sentence in tokens:
-            padding = [0] * (max_len - len(sentence))
-            padded_tokens.append(sentence + padding)
+    # LRU cache는 worker마다 새로 채움
+    def _worker_copy(self) -> 'BPETokenizer':
+        tokenizer = super()._worker_copy()
+        tokenizer.cache = collections.OrderedDict()
+        return tokenizer
+
+    def _set_merges(self, vocab: dict[str, int], merges: list[tuple[str, str]]) -> None:
+        self.vocab = vocab
+        self.merges = list(merges)
+        # pair -> merge 순서 (작을수록 먼저 merge)
+        self.ranks = {pair: rank for rank, pair in enumerate(merges)}
+        self.cache.clear()
+
+    # vocab의 id 순서가 곧 string table 순서
+    def _get_state(self):
+        tokens = sorted(self.vocab, key=self.vocab.get)
+        merges = [(self.vocab[first], self.vocab[second]) for first, second in self.merges]
+        return tokens, [self.vocab[token] for token in tokens], merges
+
+    def _set_state(self, tokens: list[str], ids: list[int], merges: list[tuple[int, int]]) -> None:
+        self._set_merges(dict(zip(tokens, ids)), [(tokens[first], tokens[second]) for first, second in merges])
+
+    def _attach(self, mapped: MappedTokenizerFile) -> None:
+        self.vocab = MappedVocab(mapped)
+        self.merges = MappedMerges(mapped)
+        self.ranks = MappedRanks(mapped)
+        self.cache.clear()
+        
+    # 문장을 pre_tokenizer로 단어로 나누고 단어마다 subword id로 변환
+    def _encode(self, sentence: str) -> list[int]:
+        ids = []
+        for word in self.pre_tokenizer(sentence):
+            ids.extend(self._encode_word(word))
+        return ids
+
+    # 단어의 subword id 반환, 자주 나오는 단어는 LRU cache에서 바로 꺼냄
+    def _encode_word(self, word: str) -> list[int]:
+        cache = self.cache
+        ids = cache.get(word)
+        if ids is not None:
+            cache.move_to_end(word)
+            return ids
+        unk = self.vocab[UNK]
+        ids = [self.vocab.get(token, unk) for token in self._bpe(word)]
+        cache[word] = ids
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return ids
+
+    # 학습된 merge를 순서(rank)대로 적용해서 단어를 subword로 나눔
+    def _bpe(self, word: str) -> list[str]:
+        return apply_merges(list(word) + [EOW], self.ranks)
+
+    # 단어 끝 표시는 띄어쓰기로 바꿈
+    def _decode_piece(self, token: str) -> str:
+        return token[:-len(EOW)] + ' ' if token.endswith(EOW) else token
+
+    def _join_pieces(self, pieces: list[str]) -> str:
+        return ''.join(pieces).rstrip(' ')
+
+
+class Trie:
+    # 토큰 문자열을 index하는 trie
+    # 상태(state)는 정수이고 (상태, 문자) -> 다음 상태 dict 하나에 모든 간선을 저장 (0 = root)
+    def __init__(self) -> None:
+        self.edges = {}
+        # values[state]: state에서 끝나는 토큰의 값, 토큰 끝이 아니면 None
+        self.values = [None]
+
+    def add(self, token: str, value: int) -> None:
+        state = 0
+        for char in token:
+            next_state = self.edges.get((state, char))
+            if next_state is None:
+                next_state = len(self.values)
+                self.edges[(state, char)] = next_state
+                self.values.append(None)
+            state = next_state
+        self.values[state] = value
+
+    # return: state에서 text를 따라간 상태, 중간에 끊기면 None
+    def walk(self, text: str, state: int = 0) -> Optional[int]:
+        for char in text:
+            state = self.edges.get((state, char))
+            if state is None:
+                return None
+        return state
+
+    # text[start:]의 앞부분 중 state에서 시작해서 trie에 있는 가장 긴 토큰을 찾음
+    # return: (토큰 끝 위치, 토큰 값), 없으면 (start, None)
+    def longest_match(self, text: str, start: int, state: int = 0) -> tuple[int, Optional[int]]:
+        edges = self.edges
+        values = self.values
+        end, value = start, None
+        for pos in range(start, len(text)):
+            state = edges.get((state, text[pos]))
+            if state is None:
+                break
+            if values[state] is not None:
+                end, value = pos + 1, values[state]
+        return end, value
+
+
+class VocabMatcher:
+    # Trie와 같은 방법으로 가장 긴 토큰을 찾지만 trie를 만들지 않고 vocab에서 길이를 줄여 가며 찾음
+    # 상태는 찾는 토큰 앞에 붙일 문자열 (0 = root)
+    def __init__(self, vocab) -> None:
+        self.vocab = vocab
+
+    def walk(self, text: str, state=0) -> str:
+        return (state or '') + text
+
+    # return: Trie.longest_match 참고
+    def longest_match(self, text: str, start: int, state=0) -> tuple[int, Optional[int]]:
+        prefix = state or ''
+        vocab = self.vocab
+        for end in range(len(text), start, -1):
+            token = prefix + text[start:end]
+            if token == PAD or token == UNK:
+                continue
+            value = vocab.get(token)
+            if value is not None:
+                return end, value
+        return start, None
+
+
+class WordTokenizer(BaseTokenizer):
+    kind = 'word'
+
+    # corpus: 학습에 사용할 말뭉치
+    # subword: True이면 vocab에 없는 단어를 vocab에서 가장 긴 조각부터 잘라서 나눔 (WordPiece 방식)
+    #          단어 중간부터 시작하는 조각은 '##'을 붙여서 구분
+    # keep_corpus, pre_tokenizer, num_workers: BaseTokenizer 참고
+    def __init__(self, corpus: Optional[Union[list[str], str]] = None, subword: bool = False,
+                 keep_corpus: bool = True, pre_tokenizer: Optional[PreTokenizer] = None,
+                 num_workers: int = 1) -> None:
+        super().__init__(corpus, keep_corpus, pre_tokenizer, num_workers)
+        self.subword = subword
+        self.trie = None
+        self.continuation = None
+        # 학습한 corpus의 전체 단어 빈도, 학습 후 추가된 corpus를 이어서 학습할 때 사용
+        self.word_counts = None
+
+    # vocab 생성, 빈도가 높은 단어부터 pad = 0, unk = 1 다음의 id를 차례로 할당
+    # num_workers: corpus의 단어 빈도를 셀 process 수
+    # corpus: 주어지면 self.corpus 대신 학습에 사용 (generator 등 한 번만 읽을 수 있는 iterable도 가능)
+    # min_freq: 이 빈도보다 적게 나온 단어는 vocab에서 제외
+    # max_vocab_size: pad, unk를 포함한 vocab 최대 크기 (subword이면 문자 조각은 항상 포함)
+    # 이미 학습된 tokenizer면 add_corpus나 corpus로 추가된 단어의 빈도만 더하고,
+    # 그 중 vocab에 없던 단어를 기존 id 뒤에 추가 (기존 토큰의 id는 유지)
+    # load, attach한 tokenizer는 단어 빈도가 없으므로 이어서 학습할 수 없음
+    def train(self, n_iter: Optional[int] = None, num_workers: int = 1, corpus: Optional[Iterable[str]] = None,
+              min_freq: int = 1, max_vocab_size: Optional[int] = None) -> None:
+        if self.word_counts is None and self.vocab is not None:
+            raise ValueError("Tokenizer has no training state to continue from (loaded or attached); "
+                             "train a new tokenizer")
+        if self.word_counts is not None:
+            delta = self._take_pending(corpus, num_workers)
+            self.word_counts.update(delta)
+            added = self._add_tokens(delta, min_freq, max_vocab_size)
+            if self.subword:
+                for token in added:
+                    self.trie.add(token, self.vocab[token])
+                self.continuation = self.trie.walk('##')
+            return
+        if corpus is None:
+            corpus = self.corpus
+        # corpus를 pre_tokenizer로 단어로 나눠서 빈도를 셈
+        self.word_counts = self._take_pending(corpus, num_workers)
+        self.vocab = {PAD: 0, UNK: 1}
+        self._add_tokens(self.word_counts, min_freq, max_vocab_size)
+        if self.subword:
+            self._build_trie()
+
+    # candidates 중 vocab에 없는 단어를 빈도 순으로 vocab 뒤에 추가
+    # return: 추가된 토큰
+    def _add_tokens(self, candidates: Iterable[str], min_freq: int, max_vocab_size: Optional[int]) -> list[str]:
+        counts = self.word_counts
+        pieces = {}
+        if self.subword:
+            char_pieces = self._char_pieces({word: counts[word] for word in candidates})
+            pieces = {piece: freq for piece, freq in char_pieces.items() if piece not in self.vocab}
+        words = [word for word in candidates if counts[word] >= min_freq and word not in self.vocab and word not in pieces]
+        words.sort(key=lambda word: (-counts[word], word))
+        if max_vocab_size is not None:
+            words = words[:max(0, max_vocab_size - len(self.vocab) - len(pieces))]
+        ranked = sorted([*((word, counts[word]) for word in words), *pieces.items()], key=lambda item: (-item[1], item[0]))
+        for token, _ in ranked:
+            self.vocab[token] = len(self.vocab)
+        return [token for token, _ in ranked]
+
+    # 어떤 단어든 나눌 수 있도록 단어 첫 문자 c와 중간 문자 ##c를 조각으로 사용
+    # return: {조각: 빈도}
+    def _char_pieces(self, counts: dict[str, int]) -> collections.Counter:
+        pieces = collections.Counter()
+        for word, freq in counts.items():
+            pieces[word[0]] += freq
+            for char in word[1:]:
+                pieces['##' + char] += freq
+        return pieces
+
+    def _drop_training_state(self) -> None:
+        super()._drop_training_state()
+        self.word_counts = None
+
+    def _build_trie(self) -> None:
+        self.trie = Trie()
+        for token, value in self.vocab.items():
+            if token not in (PAD, UNK):
+                self.trie.add(token, value)
+        # 단어 중간 조각은 '##' 다음 상태부터 찾음
+        self.continuation = self.trie.walk('##')
+
+    # 문장을 pre_tokenizer로 단어로 나누고 단어마다 vocab에서 찾음
+    def _encode(self, sentence: str) -> list[int]:
+        vocab = self.vocab
+        unk = vocab[UNK]
+        words = self.pre_tokenizer(sentence)
+        if not self.subword:
+            return [vocab[word] if word in vocab else unk for word in words]
+        ids = []
+        for word in words:
+            if word in vocab:
+                ids.append(vocab[word])
+            else:
+                ids.extend(self._segment(word, unk))
+        return ids
+
+    # 앞에서부터 trie에서 가장 길게 일치하는 조각을 잘라냄
+    # 잘라낼 수 없는 위치가 있으면 단어 전체를 unk로 처리
+    def _segment(self, word: str, unk: int) -> list[int]:
+        pieces = []
+        start, state = 0, 0
+        while start < len(word):
+            if state is None:
+                return [unk]
+            start, value = self.trie.longest_match(word, start, state)
+            if value is None:
+                return [unk]
+            pieces.append(value)
+            state = self.continuation
+        return pieces
+
+    # 단어 앞에 띄어쓰기를 붙이고, subword이면 '##' 조각은 앞 조각에 바로 이어 붙임
+    def _decode_piece(self, token: str) -> str:
+        if self.subword and token.startswith('##') and len(token) > 2:
+            return token[2:]
+        return ' ' + token
+
+    def _join_pieces(self, pieces: list[str]) -> str:
+        text = ''.join(pieces)
+        return text[1:] if text.startswith(' ') else text
+
+    def _get_state(self):
+        return list(self.vocab), list(self.vocab.values()), []
+
+    def _set_state(self, tokens: list[str], ids: list[int], merges: list[tuple[int, int]]) -> None:
+        self.vocab = dict(zip(tokens, ids))
+        if self.subword:
+            self._build_trie()
 
-        return padded_tokens
\ No newline at end of file
+    # subword이면 trie를 만들지 않고 vocab에서 바로 조각을 찾음
+    def _attach(self, mapped: MappedTokenizerFile) -> None:
+        self.vocab = MappedVocab(mapped)
+        if self.subword:
+            self.trie = VocabMatcher(self.vocab)
+            self.continuation = self.trie.walk('##')
@@ -0,0 +1,187 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from YBIGTA.sketch import CountMinSketch, get_top_pairs
+from YBIGTA.tokenizers import BPETokenizer, BPETrainer, ShardedBPETrainer, WordTokenizer, get_stats, get_vocab, merge_vocab, peak_memory_mb
+
+
+# Zipf 분포를 따르는 단어로 만든 합성 말뭉치
+# n_docs: 문서 수
+# words_per_doc: 문서 하나의 단어 수
+# vocab_size: 서로 다른 단어 수
+# s: Zipf 지수 (클수록 자주 나오는 단어에 몰림)
+def make_zipf_corpus(n_docs: int, words_per_doc: int = 200, vocab_size: int = 20000, s: float = 1.1, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = list({''.join(rng.choices(letters, k=rng.randint(2, 10))) for _ in range(vocab_size)})
+    weights = [1 / rank ** s for rank in range(1, len(words) + 1)]
+    cum_weights = list(itertools.accumulate(weights))
+    return [' '.join(rng.choices(words, cum_weights=cum_weights, k=words_per_doc)) for _ in range(n_docs)]
+
+
+# return: (결과, 걸린 시간(초))
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# 한 문장씩 tokenize, 한 번에 encode_batch 했을 때의 초당 토큰 수
+def bench_encode(tokenizer, corpus: list[str]) -> dict:
+    encoded, single_sec = timed(lambda: [tokenizer.tokenize(doc) for doc in corpus])
+    n_tokens = sum(map(len, encoded))
+    batch, batch_sec = timed(tokenizer.encode_batch, corpus)
+    return {
+        "n_tokens": n_tokens,
+        "single_sec": single_sec,
+        "single_tokens_per_sec": n_tokens / single_sec,
+        "batch_sec": batch_sec,
+        "batch_tokens_per_sec": int(batch["lengths"].sum()) / batch_sec,
+    }
+
+
+def bench_bpe(corpus: list[str], n_iter: int) -> dict:
+    vocab, get_vocab_sec = timed(get_vocab, corpus)
+    pairs, get_stats_sec = timed(get_stats, vocab)
+    best = max(pairs, key=pairs.get)
+    _, merge_vocab_sec = timed(merge_vocab, best, vocab)
+
+    tokenizer = BPETokenizer(corpus)
+    _, train_sec = timed(tokenizer.train, n_iter)
+    n_merges = len(tokenizer.merges)
+    return {
+        "get_vocab_sec": get_vocab_sec,
+        "get_stats_sec": get_stats_sec,
+        "merge_vocab_sec": merge_vocab_sec,
+        "train_sec": train_sec,
+        "n_merges": n_merges,
+        "merges_per_sec": n_merges / train_sec if train_sec > 0 else None,
+        "vocab_size": len(tokenizer.vocab),
+        "encode": bench_encode(tokenizer, corpus),
+    }
+
+
+def bench_word(corpus: list[str], n_iter: int) -> dict:
+    tokenizer = WordTokenizer(corpus)
+    _, train_sec = timed(tokenizer.train)
+    return {
+        "train_sec": train_sec,
+        "vocab_size": len(tokenizer.vocab),
+        "encode": bench_encode(tokenizer, corpus),
+    }
+
+
+# get_top_pairs가 get_stats의 상위 pair를 얼마나 찾는지와 메모리
+# recall: 실제 상위 k개 중 후보에 들어간 비율
+# exact_pairs: cutoff보다 빈도가 커서 정확한 순위가 확정된 pair 수
+# pair 수가 충분히 많도록 n_iter번 merge한 vocab에서 측정
+def bench_pairs(corpus: list[str], n_iter: int, ks: tuple[int, ...] = (10, 100, 1000), width: int = 1 << 16) -> dict:
+    trainer = BPETrainer(get_vocab(corpus))
+    trainer.train(n_iter)
+    vocab = trainer.get_vocab()
+    pairs, exact_sec = timed(get_stats, vocab)
+    ranked = sorted(pairs, key=lambda pair: (-pairs[pair], pair))
+    report = {
+        "n_pairs": len(pairs),
+        "exact_sec": exact_sec,
+        "exact_table_mb": (sys.getsizeof(pairs) + sum(sys.getsizeof(pair) for pair in pairs)) / 2 ** 20,
+        "sketch_mb": CountMinSketch(width).nbytes() / 2 ** 20,
+    }
+    for k in ks:
+        top, sec = timed(get_top_pairs, vocab, k, width=width)
+        true_top = set(ranked[:k])
+        report[f"top_{k}"] = {
+            "sec": sec,
+            "recall": len(true_top & top.counts.keys()) / max(1, len(true_top)),
+            "counts_exact": all(pairs[pair] == count for pair, count in top.counts.items()),
+            # best()는 확정할 수 없으면 None
+            "best_correct": top.best() in (None, ranked[0] if ranked else None),
+            "exact_pairs": len(top.exact()),
+            "cutoff": top.cutoff,
+        }
+    # 전체 pair 빈도로 학습 (merge_batch_size) vs 상위 pair만 세서 학습 (approximate_k)
+    exact_merges, exact_train_sec = timed(BPETrainer(get_vocab(corpus)).train, n_iter, merge_batch_size=64)
+    approximate_merges, approximate_train_sec = timed(BPETrainer(get_vocab(corpus)).train, n_iter, approximate_k=64)
+    report["train"] = {
+        "exact_sec": exact_train_sec,
+        "approximate_sec": approximate_train_sec,
+        "same_merges": approximate_merges == exact_merges,
+    }
+    return report
+
+
+# 한 process에서 학습 vs 단어를 num_shards개의 process에 나눠서 학습 (ShardedBPETrainer)
+# process별 CPU 시간도 기록: core가 num_shards + 1개 이상이면 걸리는 시간은 대략
+# coordinator CPU + shard CPU 중 최대 + 통신 대기 (critical_path_cpu_sec는 통신을 뺀 하한, 측정값이 아님)
+# cpu_count가 num_shards보다 작으면 모든 process의 CPU 시간이 더해지므로 한 process보다 느림
+def bench_sharded(corpus: list[str], n_iter: int, shard_counts: tuple[int, ...] = (2, 4),
+                  merge_batch_size: int = 32) -> dict:
+    vocab = get_vocab(corpus)
+    expected, single_sec = timed(BPETrainer(vocab).train, n_iter)
+    report = {"cpu_count": multiprocessing.cpu_count(), "single_sec": single_sec}
+    for num_shards in shard_counts:
+        with ShardedBPETrainer(vocab, num_shards) as trainer:
+            coordinator_start, shard_start = trainer.cpu_times()
+            merges, train_sec = timed(trainer.train, n_iter, merge_batch_size=merge_batch_size)
+            coordinator_end, shard_end = trainer.cpu_times()
+        coordinator_cpu = coordinator_end - coordinator_start
+        shard_cpu = [end - begin for begin, end in zip(shard_start, shard_end)]
+        report[f"shards_{num_shards}"] = {
+            "train_sec": train_sec,
+            "merges_per_round": len(merges) / trainer.n_rounds if trainer.n_rounds else None,
+            "speedup": single_sec / train_sec,
+            "coordinator_cpu_sec": coordinator_cpu,
+            "shard_cpu_sec": shard_cpu,
+            "critical_path_cpu_sec": coordinator_cpu + max(shard_cpu),
+            "same_merges": merges == expected,
+        }
+    return report
+
+
+BENCHMARKS = {"bpe": bench_bpe, "word": bench_word, "pairs": bench_pairs, "sharded": bench_sharded}
+
+
+# 최대 RSS가 다른 측정에 섞이지 않도록 새 process에서 실행
+# (sharded가 process를 새로 만들 수 있도록 daemon이 아닌 ProcessPoolExecutor 사용)
+def _run_case(name: str, n_docs: int, n_iter: int, seed: int, word_types: int) -> dict:
+    corpus = make_zipf_corpus(n_docs, vocab_size=word_types, seed=seed)
+    result = BENCHMARKS[name](corpus, n_iter)
+    result["peak_rss_mb"] = peak_memory_mb()
+    return result
+
+
+# word_types: 말뭉치의 단어 종류 수 (merge 하나가 훑는 단어 수가 여기에 비례)
+def run(sizes: list[int], tokenizers: list[str], n_iter: int, seed: int = 0, word_types: int = 20000) -> list[dict]:
+    results = []
+    for n_docs in sizes:
+        for name in tokenizers:
+            with concurrent.futures.ProcessPoolExecutor(1) as pool:
+                result = pool.submit(_run_case, name, n_docs, n_iter, seed, word_types).result()
+            results.append({"tokenizer": name, "n_docs": n_docs, "n_iter": n_iter, "word_types": word_types,
+                            **result})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("-t", "--tokenizers", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("-i", "--n_iter", type=int, default=1000)
+    parser.add_argument("-o", "--output", type=str, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--word_types", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.tokenizers, args.n_iter, args.seed, args.word_types)
+    report = json.dumps(results, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as f:
+            f.write(report)
@@ -1,44 +1,253 @@
 import argparse
+import collections
+import itertools
 import os, tarfile
+from concurrent.futures import ThreadPoolExecutor
 from urllib.request import urlretrieve
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
-from YBIGTA.tokenizers import BPETokenizer, WordTokenizer
+from YBIGTA.pretokenizer import PUNCT_PATTERN, PreTokenizer
+from YBIGTA.storage import corpus_fingerprint, read_counts_file, write_counts_file
+from YBIGTA.tokenizers import BPETokenizer, ProgressLogger, WordTokenizer, count_words
+
+URL = "https://huggingface.co/datasets/cnn_dailymail/resolve/script/data/cnn_stories.tgz"
 
 
 def load_corpus(
-    url: str = "https://huggingface.co/datasets/cnn_dailymail/resolve/script/data/cnn_stories.tgz",
+    url: str = URL,
     dl_name: str = "dataset.tgz",
     text_dir: str = "cnn/stories/",
-    n: Optional[int] = None
+    n: Optional[int] = None,
+    num_threads: int = 8
 ) -> list[str]:
     if not os.path.exists(text_dir):
         if not os.path.exists(dl_name):
             urlretrieve(url, dl_name)
-        tarfile.open(dl_name).extractall()
+        with tarfile.open(dl_name) as tar:
+            members = tar.getmembers()
+            tar.extractall()
+        # 풀린 디렉터리도 tarball과 같은 순서로 읽도록 member 순서를 기록
+        names = [member.name[len(text_dir):] for member in members if _in_text_dir(member, text_dir)]
+        with open(_order_path(text_dir), "w", encoding="utf-8") as f:
+            f.write("".join(name + "\n" for name in names))
 
-    ls = os.listdir(text_dir)[:n]
-    dir_to_text = lambda f: open(os.path.join(text_dir, f), encoding="utf-8").read()
-    dataset = [*map(dir_to_text, ls)]
+    # iter_corpus와 같은 문서를 같은 순서로 읽도록 tarball 순서로 앞에서부터 n개
+    ls = _dir_names(text_dir)[:n]
+    paths = (os.path.join(text_dir, f) for f in ls)
+    dataset = [*read_files(paths, num_threads)]
     return dataset
 
 
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+# paths의 파일을 num_threads개의 thread로 동시에 읽어서 paths 순서대로 yield
+# 메모리에 올라가는 파일 수가 제한되도록 한 번에 num_threads * 4개까지만 읽기 요청
+def read_files(paths: Iterable[str], num_threads: int = 8) -> Iterator[str]:
+    if num_threads <= 1:
+        yield from map(_read_text, paths)
+        return
+    with ThreadPoolExecutor(num_threads) as executor:
+        pending = collections.deque()
+        for path in paths:
+            pending.append(executor.submit(_read_text, path))
+            if len(pending) >= num_threads * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# load_corpus와 같은 문서 (tarball 순서로 앞에서부터 n개)를 같은 순서로 하나씩 읽어서 yield
+# 압축을 풀지 않고 tarball member를 읽고, 이미 풀린 text_dir이 있으면 파일을 하나씩 읽음
+def iter_corpus(
+    url: str = URL,
+    dl_name: str = "dataset.tgz",
+    text_dir: str = "cnn/stories/",
+    n: Optional[int] = None,
+    num_threads: int = 8
+) -> Iterator[str]:
+    if os.path.exists(text_dir):
+        docs = _iter_dir(text_dir, num_threads)
+    else:
+        if not os.path.exists(dl_name):
+            urlretrieve(url, dl_name)
+        docs = _iter_tar(dl_name, text_dir, n)
+    yield from itertools.islice(docs, n)
+
+
+def _iter_dir(text_dir: str, num_threads: int) -> Iterator[str]:
+    yield from read_files((os.path.join(text_dir, name) for name in _dir_names(text_dir)), num_threads)
+
+
+# load_corpus가 압축을 풀 때 tarball 안의 text_dir 파일 순서를 기록하는 파일 (text_dir 옆에 둠)
+def _order_path(text_dir: str) -> str:
+    return os.path.normpath(text_dir) + ".order"
+
+
+def _in_text_dir(member: tarfile.TarInfo, text_dir: str) -> bool:
+    return member.isfile() and member.name.startswith(text_dir)
+
+
+# return: text_dir 안의 파일 이름 (tarball 순서)
+#         순서를 기록한 파일이 없으면 (직접 푼 디렉터리) 파일 이름 순
+def _dir_names(text_dir: str) -> list[str]:
+    order_path = _order_path(text_dir)
+    if os.path.exists(order_path):
+        with open(order_path, encoding="utf-8") as f:
+            return f.read().splitlines()
+    with os.scandir(text_dir) as entries:
+        return sorted(entry.name for entry in entries if entry.is_file())
+
+
+# tarball 안의 text_dir 파일을 tarball 순서로 앞에서부터 n개 yield
+# 한 번만 앞에서부터 읽고 문서를 보관하지 않으므로 메모리에는 문서 하나만 올라감
+def _iter_tar(dl_name: str, text_dir: str, n: Optional[int] = None) -> Iterator[str]:
+    if n is not None and n <= 0:
+        return
+    count = 0
+    # "r|gz": 앞에서부터 순서대로만 읽는 streaming mode
+    with tarfile.open(dl_name, "r|gz") as tar:
+        for member in tar:
+            if not _in_text_dir(member, text_dir):
+                continue
+            yield tar.extractfile(member).read().decode("utf-8")
+            count += 1
+            if count == n:
+                return
+
+
+# corpus의 단어 빈도를 cache_dir에 저장해 두고, 같은 corpus 설정이면 다시 세지 않고 읽음
+# corpus 출처 (url, 받은 파일의 크기와 수정 시각), 문서 수, 전처리 (pre_tokenizer) 설정이 cache key
+# return: (단어 빈도, cache에서 읽었는지 여부)
+def cached_word_counts(
+    cache_dir: str,
+    url: str = URL,
+    dl_name: str = "dataset.tgz",
+    text_dir: str = "cnn/stories/",
+    n: Optional[int] = None,
+    num_workers: int = 1,
+    num_threads: int = 8,
+    pre_tokenizer: Optional[PreTokenizer] = None
+) -> tuple[dict[str, int], bool]:
+    if pre_tokenizer is None:
+        pre_tokenizer = PreTokenizer()
+    if not os.path.exists(text_dir) and not os.path.exists(dl_name):
+        urlretrieve(url, dl_name)
+    # iter_corpus가 실제로 읽는 쪽 (풀린 text_dir이 있으면 text_dir)을 key에 사용
+    source = text_dir if os.path.exists(text_dir) else dl_name
+    stat = os.stat(source)
+    key = corpus_fingerprint(
+        url=url,
+        source=source,
+        # 디렉터리 크기는 내용과 상관없으므로 파일 수를 사용
+        source_size=len(os.listdir(source)) if os.path.isdir(source) else stat.st_size,
+        source_mtime=stat.st_mtime_ns,
+        n_corpus=n,
+        split=pre_tokenizer.settings(),
+    )
+    path = os.path.join(cache_dir, f"word_counts-{key}.bin")
+    if os.path.exists(path):
+        return read_counts_file(path), True
+    corpus = iter_corpus(url, dl_name, text_dir, n, num_threads)
+    counts = count_words(corpus, num_workers, pre_tokenizer)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_counts_file(path, counts)
+    return counts, False
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--use_bpe", type=bool, default=True)
     parser.add_argument("-c", "--n_corpus", type=int, default=40000)
     parser.add_argument("-i", "--n_iter", type=int, default=30000)
+    parser.add_argument("-w", "--num_workers", type=int, default=1)
+    parser.add_argument("--num_threads", type=int, default=8)
+    parser.add_argument("-s", "--stream", action="store_true")
+    parser.add_argument("-p", "--tokenizer_path", type=str, default=None)
+    parser.add_argument("-l", "--log_every", type=int, default=0)
+    parser.add_argument("--checkpoint_path", type=str, default=None)
+    parser.add_argument("--checkpoint_every", type=int, default=1000)
+    parser.add_argument("--cache_dir", type=str, default=None)
+    parser.add_argument("--merge_batch_size", type=int, default=None)
+    parser.add_argument("--num_shards", type=int, default=None)
+    parser.add_argument("--approximate_k", type=int, default=None)
+    parser.add_argument("-e", "--encode_path", type=str, default=None)
+    parser.add_argument("--split_punctuation", action="store_true")
+    parser.add_argument("--normalization", choices=["NFC", "NFKC", "NFD", "NFKD"], default=None)
     args = parser.parse_args()
 
     use_bpe = args.use_bpe
     n_corpus = args.n_corpus
     n_iter = args.n_iter
+    num_workers = args.num_workers
+    num_threads = args.num_threads
+    stream = args.stream
+    tokenizer_path = args.tokenizer_path
+    log_every = args.log_every
+    checkpoint_path = args.checkpoint_path
+    checkpoint_every = args.checkpoint_every
+    cache_dir = args.cache_dir
+    merge_batch_size = args.merge_batch_size
+    num_shards = args.num_shards
+    approximate_k = args.approximate_k
+    encode_path = args.encode_path
+    # 문장부호를 단어와 나누고 (split_punctuation) 유니코드 정규화 (normalization)
+    pre_tokenizer = PreTokenizer(PUNCT_PATTERN if args.split_punctuation else None, args.normalization)
 
-    corpus = load_corpus(n=n_corpus)
     SelectedTokenizer = BPETokenizer if use_bpe else WordTokenizer
-    tokenizer = SelectedTokenizer(corpus[:n_corpus//2])
-    tokenizer.add_corpus(corpus[n_corpus//2:])
-    tokenizer.train(n_iter=n_iter)
+    # log_every merge마다 BPE 학습 상태 출력
+    train_kwargs = {"callbacks": [ProgressLogger(log_every)]} if use_bpe and log_every > 0 else {}
+    # round마다 최대 merge_batch_size개의 pair를 한 번에 merge
+    if use_bpe and merge_batch_size is not None:
+        train_kwargs["merge_batch_size"] = merge_batch_size
+    # 단어를 num_shards개의 process에 나눠서 pair 빈도를 셈
+    if use_bpe and num_shards is not None:
+        train_kwargs["num_shards"] = num_shards
+    # 전체 pair 빈도 table 없이 sketch로 상위 approximate_k개 후보만 정확히 세서 학습
+    if use_bpe and approximate_k is not None:
+        train_kwargs["approximate_k"] = approximate_k
+    # checkpoint_every merge마다 저장하고, 이미 checkpoint가 있으면 이어서 학습
+    if use_bpe and checkpoint_path is not None:
+        train_kwargs.update(checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every)
+        if os.path.exists(checkpoint_path):
+            train_kwargs["resume_from"] = checkpoint_path
+    if tokenizer_path is not None and os.path.exists(tokenizer_path):
+        # 저장된 tokenizer가 있으면 학습하지 않고 불러옴
+        tokenizer = SelectedTokenizer.load(tokenizer_path, pre_tokenizer=pre_tokenizer)
+        corpus = [*iter_corpus(n=10)]
+    elif cache_dir is not None:
+        # 단어 빈도 cache가 있으면 corpus를 읽지 않고 바로 merge
+        counts, hit = cached_word_counts(cache_dir, n=n_corpus, num_workers=num_workers, num_threads=num_threads,
+                                         pre_tokenizer=pre_tokenizer)
+        print(f"word counts {'loaded from' if hit else 'saved to'} {cache_dir}")
+        tokenizer = SelectedTokenizer(keep_corpus=False, pre_tokenizer=pre_tokenizer)
+        tokenizer.add_word_counts(counts)
+        tokenizer.train(n_iter=n_iter, num_workers=num_workers, **train_kwargs)
+        corpus = [*iter_corpus(n=10)]
+    elif stream:
+        # corpus 전체를 메모리에 올리지 않고 문서를 읽으면서 학습
+        tokenizer = SelectedTokenizer(pre_tokenizer=pre_tokenizer)
+        tokenizer.train(n_iter=n_iter, num_workers=num_workers, corpus=iter_corpus(n=n_corpus, num_threads=num_threads), **train_kwargs)
+        corpus = [*iter_corpus(n=10)]
+    else:
+        corpus = load_corpus(n=n_corpus, num_threads=num_threads)
+        # 원문은 저장하지 않고 단어 빈도만 보관
+        tokenizer = SelectedTokenizer(corpus[:n_corpus//2], keep_corpus=False, pre_tokenizer=pre_tokenizer,
+                                      num_workers=num_workers)
+        tokenizer.add_corpus(corpus[n_corpus//2:], num_workers=num_workers)
+        # 토큰화 예시에 쓸 문서만 남기고 corpus 해제
+        corpus = corpus[:10]
+        tokenizer.train(n_iter=n_iter, num_workers=num_workers, **train_kwargs)
+    if tokenizer_path is not None and not os.path.exists(tokenizer_path):
+        tokenizer.save(tokenizer_path)
+
+    if encode_path is not None:
+        # corpus 전체를 토큰 id 파일로 저장 (문서 단위로 np.memmap에서 읽음)
+        docs = tokenizer.encode_to_file(iter_corpus(n=n_corpus, num_threads=num_threads), encode_path,
+                                        num_workers=num_workers)
+        print(f"{len(docs)} documents, {len(docs.tokens)} tokens saved to {encode_path}")
 
     input_ids = tokenizer.tokenize(
         corpus[:10],
@@ -0,0 +1,144 @@
+import collections
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from unittest import mock
+
+import main
+from YBIGTA.pretokenizer import PUNCT_PATTERN, PreTokenizer
+from main import cached_word_counts, iter_corpus, load_corpus, read_files
+
+DOCS = ["first story text", "second story", "third one here"]
+
+class TestIterCorpus(unittest.TestCase):
+
+    def setUp(self):
+        # stories 파일 3개를 담은 작은 tarball 생성
+        self.temp_dir = tempfile.mkdtemp()
+        self.tar_path = os.path.join(self.temp_dir, "dataset.tgz")
+        with tarfile.open(self.tar_path, "w:gz") as tar:
+            for i, doc in enumerate(DOCS):
+                data = doc.encode("utf-8")
+                info = tarfile.TarInfo(f"cnn/stories/{i}.story")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        self.text_dir = os.path.join(self.temp_dir, "cnn/stories/")
+
+    def test_iter_corpus_from_tar(self):
+        docs = iter_corpus(dl_name=self.tar_path, text_dir="cnn/stories/")
+        self.assertEqual(list(docs), DOCS)
+        self.assertFalse(os.path.exists(self.text_dir))
+
+    def test_iter_corpus_limit(self):
+        docs = iter_corpus(dl_name=self.tar_path, text_dir="cnn/stories/", n=2)
+        self.assertEqual(list(docs), DOCS[:2])
+
+    def test_iter_corpus_from_dir(self):
+        with tarfile.open(self.tar_path) as tar:
+            tar.extractall(self.temp_dir)
+        docs = iter_corpus(dl_name=self.tar_path, text_dir=self.text_dir)
+        self.assertEqual(list(docs), DOCS)
+
+    def _write_shuffled_tar(self, names):
+        # 이름 순이 아닌 순서로 member를 담은 tarball
+        tar_path = os.path.join(self.temp_dir, "shuffled.tgz")
+        with tarfile.open(tar_path, "w:gz") as tar:
+            for name in names:
+                data = name.encode("utf-8") * 1000
+                info = tarfile.TarInfo(f"cnn/stories/{name}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return tar_path
+
+    def test_same_order_everywhere(self):
+        # tarball, load_corpus가 푼 디렉터리 모두 tarball member 순서
+        names = [f"{i:02d}.story" for i in range(12)]
+        shuffled = list(reversed(names[::2] + names[1::2]))
+        tar_path = self._write_shuffled_tar(shuffled)
+        expected = [name * 1000 for name in shuffled[:5]]
+        self.assertEqual(list(iter_corpus(dl_name=tar_path, text_dir="cnn/stories/", n=5)), expected)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            self.assertEqual(load_corpus(dl_name=tar_path, text_dir="cnn/stories/", n=5), expected)
+            self.assertEqual(list(iter_corpus(dl_name=tar_path, text_dir="cnn/stories/", n=5)), expected)
+        finally:
+            os.chdir(cwd)
+
+    def test_tar_not_buffered(self):
+        # member를 하나 읽을 때마다 바로 yield (다른 문서를 보관하지 않음)
+        names = [f"{i:02d}.story" for i in range(20)]
+        tar_path = self._write_shuffled_tar(names[::-1])
+        read = []
+        extractfile = tarfile.TarFile.extractfile
+
+        def counted(tar, member):
+            read.append(member.name)
+            return extractfile(tar, member)
+
+        with mock.patch.object(tarfile.TarFile, "extractfile", counted):
+            for i, doc in enumerate(iter_corpus(dl_name=tar_path, text_dir="cnn/stories/", n=10)):
+                self.assertEqual(len(read), i + 1)
+                self.assertEqual(doc, names[::-1][i] * 1000)
+        self.assertEqual(len(read), 10)
+
+    def test_load_corpus_threads(self):
+        with tarfile.open(self.tar_path) as tar:
+            tar.extractall(self.temp_dir)
+        expected = load_corpus(dl_name=self.tar_path, text_dir=self.text_dir, num_threads=1)
+        self.assertEqual(expected, DOCS)
+        for num_threads in (2, 8):
+            docs = load_corpus(dl_name=self.tar_path, text_dir=self.text_dir, num_threads=num_threads)
+            self.assertEqual(docs, expected)
+
+    def test_read_files_keeps_order(self):
+        # 동시에 읽어도 입력 순서대로 나와야 함 (in-flight 제한보다 많은 파일)
+        paths = []
+        for i in range(50):
+            path = os.path.join(self.temp_dir, f"{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"doc {i}")
+            paths.append(path)
+        self.assertEqual(list(read_files(paths, num_threads=3)), [f"doc {i}" for i in range(50)])
+
+    def test_cached_word_counts(self):
+        cache_dir = os.path.join(self.temp_dir, "cache")
+        counts, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir="cnn/stories/")
+        self.assertFalse(hit)
+        self.assertEqual(counts, collections.Counter(" ".join(DOCS).split()))
+        # 두 번째 실행은 corpus를 읽지 않고 cache에서 읽음
+        with mock.patch.object(main, "iter_corpus", side_effect=AssertionError):
+            cached, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir="cnn/stories/")
+        self.assertTrue(hit)
+        self.assertEqual(list(cached.items()), list(counts.items()))
+        # 문서 수가 다르면 다른 cache
+        counts, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir="cnn/stories/", n=1)
+        self.assertFalse(hit)
+        self.assertEqual(counts, collections.Counter(DOCS[0].split()))
+        # 단어를 나누는 설정이 다르면 다른 cache
+        counts, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir="cnn/stories/",
+                                         pre_tokenizer=PreTokenizer(PUNCT_PATTERN))
+        self.assertFalse(hit)
+
+    def test_cache_key_follows_source_read(self):
+        # 나중에 압축을 풀면 iter_corpus는 text_dir을 읽으므로 tarball로 만든 cache를 쓰지 않음
+        cache_dir = os.path.join(self.temp_dir, "cache")
+        _, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir=self.text_dir)
+        self.assertFalse(hit)
+        with tarfile.open(self.tar_path) as tar:
+            tar.extractall(self.temp_dir)
+        counts, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir=self.text_dir)
+        self.assertFalse(hit)
+        self.assertEqual(counts, collections.Counter(" ".join(DOCS).split()))
+        _, hit = cached_word_counts(cache_dir, dl_name=self.tar_path, text_dir=self.text_dir)
+        self.assertTrue(hit)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
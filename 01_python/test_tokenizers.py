@@ -0,0 +1,907 @@
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from YBIGTA import tokenizers
+from YBIGTA.pretokenizer import PUNCT_PATTERN, PreTokenizer
+from YBIGTA.sketch import CountMinSketch, get_top_pairs
+from YBIGTA.storage import MappedVocab, TokenFile, corpus_fingerprint, read_counts_file, write_counts_file
+from YBIGTA.tokenizers import (
+    BPETokenizer, BPETrainer, ShardedBPETrainer, Trie, WordTokenizer, count_words, get_vocab, get_stats, merge_vocab,
+    build_bpe_vocab, get_best_pair, merge_n_best,
+)
+
+
+def make_corpus(n_lines=200, seed=0):
+    # 빈도가 같은 pair가 많이 생기도록 작은 alphabet으로 만든 말뭉치
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcde') for _ in range(rng.randint(1, 7))) for _ in range(300)]
+    return [' '.join(rng.choice(words) for _ in range(rng.randint(1, 20))) for _ in range(n_lines)]
+
+
+def reference_merges(vocab, n_iter):
+    # 매 iteration마다 get_stats + merge_vocab을 하는 기존 방식
+    merges = []
+    for _ in range(n_iter):
+        pairs = get_stats(vocab)
+        if not pairs:
+            break
+        best = get_best_pair(pairs)
+        vocab = merge_vocab(best, vocab)
+        merges.append(best)
+    return merges, vocab
+
+
+class TestBPETrainer(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+
+    def test_same_merges_as_reference(self):
+        vocab = get_vocab(self.corpus)
+        expected_merges, expected_vocab = reference_merges(vocab, 300)
+
+        trainer = BPETrainer(vocab)
+        self.assertEqual(trainer.train(300), expected_merges)
+        self.assertEqual(trainer.get_vocab(), expected_vocab)
+
+    def test_stops_when_no_pairs_left(self):
+        trainer = BPETrainer(get_vocab(["ab ab ba"]))
+        merges = trainer.train(100)
+        self.assertEqual(len(merges), 4)
+        self.assertIsNone(trainer.best_pair())
+
+    def test_callbacks(self):
+        progress = []
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(20, callbacks=[progress.append])
+        self.assertEqual([p.n_merges for p in progress], list(range(1, 21)))
+        self.assertEqual([p.pair for p in progress], trainer.merges)
+        self.assertEqual(progress[-1].vocab_size, len(build_bpe_vocab(trainer.alphabet, trainer.merges)))
+        self.assertEqual(progress[-1].n_pairs, len(get_stats(trainer.get_vocab())))
+
+    def test_callback_stops_training(self):
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(100, callbacks=[lambda progress: progress.n_merges == 7])
+        self.assertEqual(len(trainer.merges), 7)
+
+    def test_early_stopping(self):
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(1000, target_vocab_size=40)
+        self.assertEqual(trainer.vocab_size(), 40)
+
+        progress = []
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(1000, callbacks=[progress.append], min_frequency=50)
+        self.assertTrue(all(p.frequency >= 50 for p in progress))
+        self.assertLess(trainer._best()[1], 50)
+
+    def test_tokenizer_train(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        self.assertEqual(len(tokenizer.merges), 50)
+        self.assertEqual(tokenizer.vocab['<pad>'], 0)
+        self.assertEqual(tokenizer.vocab['<unk>'], 1)
+        self.assertGreaterEqual(len(tokenizer.tokenize(self.corpus[0])), len(self.corpus[0].split()))
+
+    def test_train_on_iterable(self):
+        from_list = BPETokenizer(self.corpus)
+        from_list.train(n_iter=50)
+        from_iter = BPETokenizer()
+        from_iter.train(n_iter=50, corpus=iter(self.corpus))
+        self.assertEqual(from_iter.merges, from_list.merges)
+        self.assertEqual(from_iter.corpus, [])
+
+
+class TestMergeBatch(unittest.TestCase):
+    # 한 round에 여러 pair를 merge해도 한 번에 하나씩 merge한 것과 결과가 같아야 함
+
+    def test_same_merges_as_sequential(self):
+        for seed in range(3):
+            vocab = get_vocab(make_corpus(seed=seed))
+            expected = BPETrainer(vocab).train(400)
+            for batch_size in (2, 8, 64):
+                trainer = BPETrainer(vocab)
+                self.assertEqual(trainer.train(400, merge_batch_size=batch_size), expected)
+                self.assertEqual(trainer.get_vocab(), reference_merges(vocab, 400)[1])
+
+    def test_fewer_passes(self):
+        vocab = get_vocab(make_corpus())
+        with mock.patch.object(tokenizers, "merge_batch", wraps=tokenizers.merge_batch) as rounds:
+            BPETrainer(vocab).train(400, merge_batch_size=64)
+        self.assertLess(rounds.call_count, 200)
+
+    def test_merge_n_best(self):
+        # ('c', 'd')는 ('a', 'b')와 symbol이 겹치지 않지만
+        # ('a', 'b')를 merge하면 생기는 ('ab', 'c')가 더 빈도가 높으므로 같이 merge하면 안 됨
+        vocab = get_vocab(["abc"] * 4 + ["cd"] * 3)
+        n, merged = merge_n_best(get_stats(vocab), vocab, 3)
+        self.assertEqual(n, 1)
+        self.assertEqual(merged, reference_merges(vocab, 1)[1])
+        self.assertEqual(reference_merges(vocab, 2)[0], [('a', 'b'), ('ab', 'c')])
+
+    def test_early_stopping(self):
+        vocab = get_vocab(make_corpus())
+        for kwargs in ({"target_vocab_size": 40}, {"min_frequency": 50}):
+            expected = BPETrainer(vocab).train(1000, **kwargs)
+            self.assertEqual(BPETrainer(vocab).train(1000, merge_batch_size=16, **kwargs), expected)
+        trainer = BPETrainer(vocab)
+        trainer.train(100, callbacks=[lambda progress: progress.n_merges == 7], merge_batch_size=16)
+        self.assertEqual(trainer.get_vocab(), reference_merges(vocab, 7)[1])
+
+    def test_progress_same_as_sequential(self):
+        # callback에 넘기는 빈도와 pair table 크기도 한 번에 하나씩 merge할 때와 같아야 함
+        vocab = get_vocab(make_corpus())
+        expected, progress = [], []
+        BPETrainer(vocab).train(300, callbacks=[expected.append])
+        BPETrainer(vocab).train(300, callbacks=[progress.append], merge_batch_size=16)
+        fields = lambda p: (p.n_merges, p.pair, p.frequency, p.n_pairs, p.vocab_size)
+        self.assertEqual([fields(p) for p in progress], [fields(p) for p in expected])
+
+    def test_tokenizer_train(self):
+        corpus = make_corpus()
+        expected = BPETokenizer(corpus)
+        expected.train(n_iter=200)
+        tokenizer = BPETokenizer(corpus)
+        tokenizer.train(n_iter=200, merge_batch_size=32)
+        self.assertEqual(tokenizer.merges, expected.merges)
+        self.assertEqual(tokenizer.vocab, expected.vocab)
+        # 이후 추가된 corpus도 이어서 학습 가능
+        tokenizer.add_corpus(make_corpus(seed=1))
+        expected.add_corpus(make_corpus(seed=1))
+        tokenizer.train(n_iter=300, merge_batch_size=32)
+        expected.train(n_iter=300)
+        self.assertEqual(tokenizer.merges, expected.merges)
+
+class TestShardedTrain(unittest.TestCase):
+    # 단어를 여러 process에 나눠서 학습해도 한 process에서 학습한 것과 merge가 같아야 함
+
+    def test_same_merges_as_single_process(self):
+        for seed in range(2):
+            vocab = get_vocab(make_corpus(seed=seed))
+            expected = BPETrainer(vocab)
+            expected.train(300)
+            for num_shards, batch_size in ((2, 1), (2, 32), (3, 8)):
+                with ShardedBPETrainer(vocab, num_shards) as trainer:
+                    self.assertEqual(trainer.train(300, merge_batch_size=batch_size), expected.merges)
+                    self.assertEqual(trainer.get_vocab(), expected.get_vocab())
+                    self.assertEqual(trainer.vocab_size(), expected.vocab_size())
+
+    def test_early_stopping(self):
+        vocab = get_vocab(make_corpus())
+        for kwargs in ({"target_vocab_size": 40}, {"min_frequency": 50}):
+            expected = BPETrainer(vocab).train(1000, **kwargs)
+            with ShardedBPETrainer(vocab, 2) as trainer:
+                self.assertEqual(trainer.train(1000, **kwargs), expected)
+        with ShardedBPETrainer(vocab, 2) as trainer:
+            trainer.train(100, callbacks=[lambda progress: progress.n_merges == 7])
+            self.assertEqual(trainer.get_vocab(), reference_merges(vocab, 7)[1])
+
+    def test_progress_same_as_single_process(self):
+        vocab = get_vocab(make_corpus())
+        expected = []
+        BPETrainer(vocab).train(100, callbacks=[lambda progress: expected.append(progress)])
+        keys = lambda progress: (progress.n_merges, progress.pair, progress.frequency,
+                                 progress.n_pairs, progress.vocab_size)
+        for num_shards in (1, 2):
+            progresses = []
+            with ShardedBPETrainer(vocab, num_shards) as trainer:
+                trainer.train(100, callbacks=[lambda progress: progresses.append(progress)])
+            self.assertEqual([keys(p) for p in progresses], [keys(p) for p in expected])
+
+    def test_tokenizer_train(self):
+        corpus = make_corpus()
+        expected = BPETokenizer(corpus)
+        expected.train(n_iter=200)
+        tokenizer = BPETokenizer(corpus)
+        tokenizer.train(n_iter=200, num_shards=2)
+        self.assertEqual(tokenizer.merges, expected.merges)
+        self.assertEqual(tokenizer.vocab, expected.vocab)
+        # 한 process로 이어서 학습해도, 추가된 corpus를 다시 나눠서 학습해도 같음
+        tokenizer.add_corpus(make_corpus(seed=1))
+        expected.add_corpus(make_corpus(seed=1))
+        tokenizer.train(n_iter=250)
+        expected.train(n_iter=250)
+        self.assertEqual(tokenizer.merges, expected.merges)
+        tokenizer.train(n_iter=300, num_shards=3)
+        expected.train(n_iter=300)
+        self.assertEqual(tokenizer.merges, expected.merges)
+        self.assertEqual(tokenizer.vocab, expected.vocab)
+        # round마다 merge할 pair 수를 바꿔도 같음
+        tokenizer.train(n_iter=400, num_shards=2, merge_batch_size=8)
+        expected.train(n_iter=400)
+        self.assertEqual(tokenizer.merges, expected.merges)
+        with self.assertRaises(ValueError):
+            tokenizer.train(n_iter=450, num_shards=2, approximate_k=16)
+
+
+class TestPreTokenizer(unittest.TestCase):
+
+    def test_default_is_split(self):
+        pre_tokenizer = PreTokenizer()
+        for text in ["", "  a  b\tc\n", "said. \u00a0 ok,"]:
+            self.assertEqual(pre_tokenizer(text), text.split())
+        corpus = make_corpus()
+        self.assertEqual(count_words(corpus, pre_tokenizer=pre_tokenizer), count_words(corpus))
+
+    def test_punctuation_and_normalization(self):
+        pre_tokenizer = PreTokenizer(PUNCT_PATTERN)
+        self.assertEqual(pre_tokenizer('He said. "Hi," ok'), ["He", "said", ".", '"', "Hi", ',"', "ok"])
+        # NFKC: 전각 문자, 합자를 정규화한 뒤에 나눔
+        pre_tokenizer = PreTokenizer(PUNCT_PATTERN, normalization="NFKC")
+        self.assertEqual(pre_tokenizer("ｆｉｎｅ！ ﬁne"), ["fine", "!", "fine"])
+        self.assertEqual(PreTokenizer(normalization="NFC")("cafe\u0301"), ["caf\u00e9"])
+        with self.assertRaises(ValueError):
+            PreTokenizer(r"(\w)+")
+        with self.assertRaises(ValueError):
+            PreTokenizer(normalization="NFX")
+
+    def test_memo(self):
+        pre_tokenizer = PreTokenizer(PUNCT_PATTERN, memo_size=2)
+        self.assertEqual(pre_tokenizer("a. b. c. a."), ["a", ".", "b", ".", "c", ".", "a", "."])
+        self.assertEqual(set(pre_tokenizer.memo), {"a.", "b."})
+        self.assertEqual(pickle.loads(pickle.dumps(pre_tokenizer)).memo, {})
+
+    def test_tokenizers_use_pre_tokenizer(self):
+        corpus = ["Hello, world.", "world, hello!"]
+        pre_tokenizer = PreTokenizer(PUNCT_PATTERN)
+        tokenizer = WordTokenizer(corpus, pre_tokenizer=pre_tokenizer)
+        tokenizer.train()
+        self.assertEqual(set(tokenizer.vocab) - {"<pad>", "<unk>"}, {"Hello", "hello", "world", ",", ".", "!"})
+        self.assertEqual(tokenizer.decode(tokenizer.tokenize("hello. world!")), "hello . world !")
+        self.assertEqual(get_vocab(corpus, pre_tokenizer=pre_tokenizer), get_vocab(["Hello , world .", "world , hello !"]))
+        for keep_corpus in (True, False):
+            tokenizer = BPETokenizer(corpus, keep_corpus=keep_corpus, pre_tokenizer=pre_tokenizer)
+            tokenizer.train(n_iter=20)
+            self.assertNotIn(("d", "."), tokenizer.merges)
+            self.assertEqual(tokenizer.tokenize("world."), tokenizer.tokenize("world ."))
+            self.assertEqual(tokenizer.tokenize(corpus * 3, num_workers=2, chunk_size=2), tokenizer.tokenize(corpus * 3))
+
+
+class TestTopPairs(unittest.TestCase):
+
+    def test_matches_get_stats(self):
+        vocab = get_vocab(make_corpus(n_lines=1000))
+        pairs = get_stats(vocab)
+        # 작은 sketch라서 추정값이 겹쳐도 후보의 빈도는 정확해야 함
+        top = get_top_pairs(vocab, 5, width=64)
+        for pair, count in top.counts.items():
+            self.assertEqual(count, pairs[pair])
+        self.assertTrue(all(count <= top.cutoff for pair, count in pairs.items() if pair not in top.counts))
+        self.assertEqual(top.exact(), {pair: count for pair, count in pairs.items() if count > top.cutoff})
+        self.assertEqual(get_top_pairs(vocab, 5).best(), get_best_pair(pairs))
+
+    def test_approximate_get_stats(self):
+        vocab = get_vocab(make_corpus(n_lines=1000))
+        pairs = get_stats(vocab)
+        approximate = get_stats(vocab, approximate=True, k=3)
+        self.assertLess(len(approximate), len(pairs))
+        self.assertTrue(all(pairs[pair] == count for pair, count in approximate.items()))
+        self.assertEqual(get_best_pair(approximate), get_best_pair(pairs))
+        with self.assertRaises(ValueError):
+            get_top_pairs(vocab, 0)
+
+    def test_approximate_train(self):
+        # 전체 pair 빈도 없이 학습해도 merge가 같아야 함
+        for seed in range(2):
+            vocab = get_vocab(make_corpus(seed=seed))
+            expected = BPETrainer(vocab).train(300)
+            for kwargs in ({"approximate_k": 2}, {"approximate_k": 8, "merge_batch_size": 32}):
+                trainer = BPETrainer(vocab)
+                self.assertEqual(trainer.train(300, **kwargs), expected)
+                self.assertIsNone(trainer.pair_counts)
+        vocab = get_vocab(make_corpus())
+        expected = BPETrainer(vocab).train(1000, min_frequency=50)
+        self.assertEqual(BPETrainer(vocab).train(1000, min_frequency=50, approximate_k=4), expected)
+
+    def test_approximate_tokenizer_train(self):
+        corpus = make_corpus()
+        expected = BPETokenizer(corpus)
+        expected.train(n_iter=200)
+        tokenizer = BPETokenizer(corpus)
+        tokenizer.train(n_iter=200, approximate_k=4)
+        self.assertEqual(tokenizer.vocab, expected.vocab)
+        # pair index는 이어서 학습할 때 다시 만듦
+        tokenizer.add_corpus(make_corpus(seed=1))
+        expected.add_corpus(make_corpus(seed=1))
+        tokenizer.train(n_iter=250)
+        expected.train(n_iter=250)
+        self.assertEqual(tokenizer.merges, expected.merges)
+
+    def test_sketch_overestimates(self):
+        sketch = CountMinSketch(width=16, depth=3)
+        hashes = np.arange(100, dtype=np.uint64) * np.uint64(2654435761)
+        counts = np.arange(100, dtype=np.float64)
+        sketch.add(hashes, counts)
+        self.assertTrue((sketch.estimate(hashes) >= counts).all())
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "checkpoint.pkl")
+
+    def test_resume_after_crash(self):
+        def crash(progress):
+            if progress.n_merges == 45:
+                raise KeyboardInterrupt
+
+        tokenizer = BPETokenizer(self.corpus)
+        with self.assertRaises(KeyboardInterrupt):
+            tokenizer.train(n_iter=200, callbacks=[crash], checkpoint_path=self.path, checkpoint_every=20)
+        self.assertEqual(len(BPETrainer.from_checkpoint(self.path).merges), 40)
+
+        resumed = BPETokenizer()
+        resumed.train(n_iter=200, resume_from=self.path)
+        expected = BPETokenizer(self.corpus)
+        expected.train(n_iter=200)
+        self.assertEqual(resumed.merges, expected.merges)
+        self.assertEqual(resumed.vocab, expected.vocab)
+
+    def test_resume_keeps_incremental_ids(self):
+        # 이어서 학습한 tokenizer의 checkpoint에서 다시 시작해도 기존 토큰 id가 같아야 함
+        expected = BPETokenizer(self.corpus)
+        expected.train(n_iter=50)
+        expected.add_corpus(["xyz xyzzy zyx"] * 30)
+        expected.train(n_iter=80, checkpoint_path=self.path)
+        resumed = BPETokenizer()
+        resumed.train(n_iter=80, resume_from=self.path)
+        self.assertEqual(resumed.merges, expected.merges)
+        self.assertEqual(resumed.vocab, expected.vocab)
+        self.assertNotEqual(resumed.vocab, build_bpe_vocab(BPETrainer.from_checkpoint(self.path).alphabet,
+                                                           resumed.merges))
+
+    def test_checkpoint_at_end(self):
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(30, checkpoint_path=self.path)
+        restored = BPETrainer.from_checkpoint(self.path)
+        self.assertEqual(restored.merges, trainer.merges)
+        self.assertEqual(restored.get_vocab(), trainer.get_vocab())
+        self.assertEqual(restored.pair_counts, trainer.pair_counts)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+class TestIncrementalTrain(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.new_corpus = make_corpus(50, seed=1) + ["xyz abcxyz"]
+
+    def test_bpe_continue_training(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        tokenizer.train(n_iter=150)
+        expected = BPETokenizer(self.corpus)
+        expected.train(n_iter=150)
+        self.assertEqual(tokenizer.merges, expected.merges)
+
+    def test_bpe_add_corpus(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        old_vocab = dict(tokenizer.vocab)
+        tokenizer.add_corpus(self.new_corpus)
+        tokenizer.train(n_iter=100)
+
+        # 추가된 단어에도 기존 merge가 적용된 상태의 pair 빈도와 같아야 함
+        vocab = get_vocab(self.corpus + self.new_corpus)
+        for pair in tokenizer.merges:
+            vocab = merge_vocab(pair, vocab)
+        trainer = tokenizer.trainer
+        self.assertEqual({trainer._pair_key(pair): count for pair, count in trainer.pair_counts.items()}, get_stats(vocab))
+        self.assertEqual({token: tokenizer.vocab[token] for token in old_vocab}, old_vocab)
+        self.assertIn("x", tokenizer.vocab)
+
+        tokenizer.train(n_iter=120)
+        self.assertEqual(len(tokenizer.merges), 120)
+        self.assertEqual({token: tokenizer.vocab[token] for token in old_vocab}, old_vocab)
+
+    def test_word_add_corpus(self):
+        tokenizer = WordTokenizer(["a a b", "b c"])
+        tokenizer.train()
+        old_vocab = dict(tokenizer.vocab)
+        tokenizer.add_corpus(["d d d c", "e"])
+        tokenizer.train()
+        self.assertEqual(tokenizer.vocab, {**old_vocab, "d": 5, "e": 6})
+        self.assertEqual(tokenizer.word_counts["c"], 2)
+
+        tokenizer.add_corpus("f")
+        tokenizer.train(corpus=["g g"], min_freq=2)
+        self.assertNotIn("f", tokenizer.vocab)
+        self.assertEqual(tokenizer.vocab["g"], 7)
+
+class TestKeepCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+
+    def test_bpe_lean_same_as_keep(self):
+        lean = BPETokenizer(self.corpus[:100], keep_corpus=False)
+        lean.add_corpus(self.corpus[100:])
+        self.assertEqual(lean.corpus, [])
+        lean.train(n_iter=100)
+        keep = BPETokenizer(self.corpus[:100])
+        keep.add_corpus(self.corpus[100:])
+        keep.train(n_iter=100)
+        self.assertEqual(lean.merges, keep.merges)
+        self.assertEqual(lean.vocab, keep.vocab)
+
+    def test_lean_parallel_count(self):
+        # 생성자와 add_corpus에서 여러 process로 세도 결과가 같고, train에서는 셀 문장이 없으면 pool을 띄우지 않음
+        lean = BPETokenizer(self.corpus[:100], keep_corpus=False, num_workers=2)
+        lean.add_corpus(self.corpus[100:], num_workers=2)
+        with mock.patch.object(tokenizers.multiprocessing, "Pool", side_effect=AssertionError):
+            lean.train(n_iter=100, num_workers=2)
+        keep = BPETokenizer(self.corpus)
+        keep.train(n_iter=100)
+        self.assertEqual(lean.merges, keep.merges)
+        self.assertEqual(lean.vocab, keep.vocab)
+
+    def test_add_corpus_keeps_caller_list(self):
+        corpus = self.corpus[:10]
+        tokenizer = BPETokenizer(corpus)
+        for line in self.corpus[10:20]:
+            tokenizer.add_corpus(line)
+        self.assertEqual(tokenizer.corpus, self.corpus[:20])
+        self.assertEqual(corpus, self.corpus[:10])
+
+    def test_word_lean_same_as_keep(self):
+        lean = WordTokenizer(self.corpus, keep_corpus=False)
+        lean.train()
+        self.assertEqual(lean.corpus, [])
+        keep = WordTokenizer(self.corpus)
+        keep.train()
+        self.assertEqual(lean.vocab, keep.vocab)
+
+class TestBaseTokenizer(unittest.TestCase):
+    # 구현하지 않은 method가 있으면 호출할 때가 아니라 만들 때 실패해야 함
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            tokenizers.BaseTokenizer()
+
+        class NoDecode(tokenizers.BaseTokenizer):
+            train = BPETokenizer.train
+            _encode = BPETokenizer._encode
+            _get_state = BPETokenizer._get_state
+            _set_state = BPETokenizer._set_state
+            _attach = BPETokenizer._attach
+
+        with self.assertRaises(TypeError):
+            NoDecode()
+        self.assertEqual(set(tokenizers.BaseTokenizer.__abstractmethods__),
+                         {'train', '_encode', '_get_state', '_set_state', '_attach', '_decode_piece', '_join_pieces'})
+
+
+class TestBPEEncode(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.tokenizer = BPETokenizer(self.corpus)
+        self.tokenizer.train(n_iter=300)
+
+    def test_encode_matches_training_segmentation(self):
+        trainer = BPETrainer(get_vocab(self.corpus))
+        trainer.train(300)
+        for segmented in trainer.get_vocab():
+            word = segmented.replace(' ', '')[:-len('</w>')]
+            self.assertEqual(' '.join(self.tokenizer._bpe(word)), segmented)
+
+    def test_unseen_word_uses_subwords(self):
+        ids = self.tokenizer.tokenize("abcdeabcde")
+        self.assertNotIn(self.tokenizer.vocab['<unk>'], ids)
+        self.assertEqual(self.tokenizer.tokenize("xyz")[0], self.tokenizer.vocab['<unk>'])
+
+    def test_cache_is_bounded(self):
+        tokenizer = BPETokenizer(self.corpus, cache_size=10)
+        tokenizer.train(n_iter=300)
+        expected = self.tokenizer.tokenize(self.corpus)
+        self.assertEqual(tokenizer.tokenize(self.corpus), expected)
+        self.assertEqual(len(tokenizer.cache), 10)
+
+class TestEncodeBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+
+    def check_batch(self, tokenizer, max_length):
+        expected = tokenizer.tokenize(self.corpus[:20], padding=True, max_length=max_length)
+        batch = tokenizer.encode_batch(self.corpus[:20], max_length=max_length)
+        self.assertEqual(batch["input_ids"].dtype, np.int32)
+        self.assertEqual(batch["input_ids"].tolist(), expected)
+        lengths = [min(len(ids), max_length) for ids in tokenizer.tokenize(self.corpus[:20])]
+        self.assertEqual(batch["lengths"].tolist(), lengths)
+        self.assertEqual(batch["attention_mask"].sum(axis=1).tolist(), lengths)
+
+    def test_bpe_encode_batch(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        self.check_batch(tokenizer, max_length=16)
+
+    def test_parallel_tokenize_keeps_order(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        expected = tokenizer.tokenize(self.corpus, padding=True)
+        self.assertEqual(tokenizer.tokenize(self.corpus, padding=True, num_workers=2, chunk_size=17), expected)
+        batch = tokenizer.encode_batch(self.corpus, num_workers=2, chunk_size=17)
+        self.assertEqual(batch["input_ids"].tolist(), expected)
+
+    def test_reuse_pool(self):
+        # start_pool로 띄운 pool을 여러 호출에서 재사용, 호출마다 pool을 새로 띄우지 않음
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        expected = tokenizer.tokenize(self.corpus)
+        with tokenizer.start_pool(2):
+            with mock.patch.object(tokenizers.multiprocessing, "Pool", side_effect=AssertionError):
+                self.assertEqual(tokenizer.tokenize(self.corpus, chunk_size=17), expected)
+                batch = tokenizer.encode_batch(self.corpus, chunk_size=17)
+                self.assertEqual([ids[:n] for ids, n in zip(batch["input_ids"].tolist(), batch["lengths"])], expected)
+                self.assertEqual(len(list(tokenizer.iter_batches(self.corpus, max_tokens=10 ** 6))), 1)
+            # 이어서 학습해서 vocab이 바뀌면 pool을 다시 띄움
+            tokenizer.train(n_iter=80)
+            self.assertEqual(tokenizer.tokenize(self.corpus, chunk_size=17), [tokenizer._encode(s) for s in self.corpus])
+        self.assertIsNone(tokenizer._pool)
+
+    def test_worker_copy(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        tokenizer.tokenize(self.corpus)
+        worker = tokenizer._worker_copy()
+        self.assertEqual((len(worker.cache), worker.trainer, worker.corpus), (0, None, []))
+        self.assertGreater(len(tokenizer.cache), 0)
+        self.assertIsNotNone(tokenizer.trainer)
+
+    def test_word_encode_batch(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        self.check_batch(tokenizer, max_length=8)
+
+    def test_iter_batches(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=50)
+        encoded = tokenizer.tokenize(self.corpus, max_length=32)
+        batches = list(tokenizer.iter_batches(self.corpus, max_tokens=128, max_length=32))
+        # 모든 문장이 한 번씩 나오고, indices로 원래 문장을 찾을 수 있어야 함
+        indices = np.concatenate([batch["indices"] for batch in batches])
+        self.assertEqual(sorted(indices.tolist()), list(range(len(self.corpus))))
+        padded = 0
+        for batch in batches:
+            input_ids = batch["input_ids"]
+            self.assertTrue(input_ids.size <= 128 or len(input_ids) == 1)
+            for row, index in zip(input_ids.tolist(), batch["indices"]):
+                ids = encoded[index]
+                self.assertEqual(row, ids + [0] * (len(row) - len(ids)))
+            padded += input_ids.size
+        # 전체를 한 batch로 padding할 때보다 padding이 적어야 함
+        self.assertLess(padded, tokenizer.encode_batch(self.corpus, max_length=32)["input_ids"].size)
+
+    def test_iter_batches_max_batch_size(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        batches = list(tokenizer.iter_batches(self.corpus, max_tokens=10 ** 6, max_batch_size=7))
+        self.assertEqual([len(batch["indices"]) for batch in batches], [7] * 28 + [4])
+
+class TestWordVocab(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = ["a a a b b c", "a b d d d d"]
+
+    def test_frequency_ranked_dense_ids(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        self.assertEqual(tokenizer.vocab, {"<pad>": 0, "<unk>": 1, "a": 2, "d": 3, "b": 4, "c": 5})
+        self.assertEqual(tokenizer.tokenize("c a e"), [5, 2, 1])
+
+    def test_min_freq(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train(min_freq=3)
+        self.assertEqual(list(tokenizer.vocab), ["<pad>", "<unk>", "a", "d", "b"])
+
+    def test_max_vocab_size(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train(max_vocab_size=4)
+        self.assertEqual(list(tokenizer.vocab), ["<pad>", "<unk>", "a", "d"])
+
+class TestWordPiece(unittest.TestCase):
+
+    def setUp(self):
+        self.tokenizer = WordTokenizer(["un happy unhappy happiness", "ness un"], subword=True)
+        self.tokenizer.train()
+        self.vocab = self.tokenizer.vocab
+
+    def test_known_word(self):
+        self.assertEqual(self.tokenizer.tokenize("unhappy"), [self.vocab["unhappy"]])
+
+    def test_longest_match_split(self):
+        # "unhappiness" -> "unhapp" 은 없으므로 "un" 다음 ##h, ##a, ...
+        ids = self.tokenizer.tokenize("unhappiness")
+        pieces = ["un"] + ["##" + char for char in "happiness"]
+        self.assertEqual(ids, [self.vocab[piece] for piece in pieces])
+
+    def test_unknown_char(self):
+        self.assertEqual(self.tokenizer.tokenize("unhappyz"), [self.vocab["<unk>"]])
+
+    def test_trie_longest_match(self):
+        trie = Trie()
+        for value, token in enumerate(["a", "ab", "abcd"]):
+            trie.add(token, value)
+        self.assertEqual(trie.longest_match("abcx", 0), (2, 1))
+        self.assertEqual(trie.longest_match("abcd", 0), (4, 2))
+        self.assertEqual(trie.longest_match("xabc", 0), (0, None))
+
+class TestSaveLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "tokenizer.bin")
+
+    def test_bpe_save_load(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        tokenizer.save(self.path)
+        loaded = BPETokenizer.load(self.path)
+        self.assertEqual(loaded.vocab, tokenizer.vocab)
+        self.assertEqual(loaded.merges, tokenizer.merges)
+        self.assertEqual(loaded.tokenize(self.corpus), tokenizer.tokenize(self.corpus))
+
+    def test_word_save_load(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        tokenizer.save(self.path)
+        loaded = WordTokenizer.load(self.path)
+        self.assertEqual(loaded.vocab, tokenizer.vocab)
+        self.assertEqual(loaded.tokenize(self.corpus), tokenizer.tokenize(self.corpus))
+
+    def test_word_subword_save_load(self):
+        tokenizer = WordTokenizer(self.corpus, subword=True)
+        tokenizer.train()
+        tokenizer.save(self.path)
+        loaded = WordTokenizer.load(self.path, subword=True)
+        text = ["abcdeabcde ab", "edcbaedcba"]
+        self.assertEqual(loaded.tokenize(text), tokenizer.tokenize(text))
+
+    def test_train_after_load(self):
+        # 불러온 tokenizer는 학습 상태가 없으므로 새 corpus만으로 처음부터 다시 학습하지 않고 에러
+        for cls, kwargs in ((BPETokenizer, {"n_iter": 150}), (WordTokenizer, {})):
+            tokenizer = cls(self.corpus)
+            tokenizer.train(**({"n_iter": 100} if cls is BPETokenizer else {}))
+            tokenizer.save(self.path)
+            for loaded in (cls.load(self.path), cls.attach(self.path)):
+                loaded.add_corpus("abc abd")
+                with self.assertRaises(ValueError):
+                    loaded.train(**kwargs)
+                self.assertEqual(dict(loaded.vocab), tokenizer.vocab)
+
+    def test_word_counts_file(self):
+        counts = count_words(self.corpus + ["한국어 단어 한국어"])
+        write_counts_file(self.path, counts)
+        loaded = read_counts_file(self.path)
+        self.assertEqual(list(loaded.items()), list(counts.items()))
+
+    def test_train_from_word_counts(self):
+        # 미리 센 단어 빈도로 학습해도 corpus로 학습한 것과 같아야 함
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        write_counts_file(self.path, count_words(self.corpus))
+        from_counts = BPETokenizer(keep_corpus=False)
+        from_counts.add_word_counts(read_counts_file(self.path))
+        from_counts.train(n_iter=100)
+        self.assertEqual(from_counts.merges, tokenizer.merges)
+        self.assertEqual(from_counts.vocab, tokenizer.vocab)
+
+    def test_corpus_fingerprint(self):
+        self.assertEqual(corpus_fingerprint(n_corpus=10, split="whitespace"),
+                         corpus_fingerprint(split="whitespace", n_corpus=10))
+        self.assertNotEqual(corpus_fingerprint(n_corpus=10), corpus_fingerprint(n_corpus=11))
+
+    def test_load_wrong_kind(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        tokenizer.save(self.path)
+        with self.assertRaises(ValueError):
+            BPETokenizer.load(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+class TestAttach(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "tokenizer.bin")
+        self.text = self.corpus[:20] + ["abcdeabcde ab", "edcbaedcba", "xyz ab"]
+
+    def test_bpe_attach(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        tokenizer.save(self.path)
+        attached = BPETokenizer.attach(self.path)
+        self.assertIsInstance(attached.vocab, MappedVocab)
+        self.assertEqual(dict(attached.vocab), tokenizer.vocab)
+        self.assertEqual(list(attached.merges), tokenizer.merges)
+        self.assertEqual(dict(attached.ranks), tokenizer.ranks)
+        self.assertNotIn("xyz", attached.vocab)
+        self.assertIsNone(attached.ranks.get(("x", "y")))
+        self.assertEqual(attached.tokenize(self.text), tokenizer.tokenize(self.text))
+
+    def test_word_attach(self):
+        for subword in (False, True):
+            tokenizer = WordTokenizer(self.corpus, subword=subword)
+            tokenizer.train()
+            tokenizer.save(self.path)
+            attached = WordTokenizer.attach(self.path, subword=subword)
+            self.assertEqual(attached.tokenize(self.text), tokenizer.tokenize(self.text))
+
+    def test_pickle_sends_path(self):
+        # worker에는 vocab이 아니라 파일 경로만 넘어감
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        tokenizer.save(self.path)
+        attached = BPETokenizer.attach(self.path)
+        self.assertLess(len(pickle.dumps(attached)), 1000)
+        self.assertEqual(pickle.loads(pickle.dumps(attached)).tokenize(self.text), tokenizer.tokenize(self.text))
+        self.assertEqual(attached.tokenize(self.corpus, num_workers=2, chunk_size=17), tokenizer.tokenize(self.corpus))
+
+    def test_attach_wrong_kind(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        tokenizer.save(self.path)
+        with self.assertRaises(ValueError):
+            BPETokenizer.attach(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+class TestDecode(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.text = self.corpus[:20] + ["abcdeabcde ab", "  edcba   ab "]
+
+    def test_bpe_round_trip(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        for sentence in self.text:
+            self.assertEqual(tokenizer.decode(tokenizer.tokenize(sentence)), ' '.join(sentence.split()))
+        self.assertEqual(tokenizer.decode(tokenizer.tokenize("ab xyz")), "ab <unk><unk><unk>")
+
+    def test_word_round_trip(self):
+        tokenizer = WordTokenizer(self.corpus[:100], subword=True)
+        tokenizer.train()
+        for sentence in self.text:
+            self.assertEqual(tokenizer.decode(tokenizer.tokenize(sentence)), ' '.join(sentence.split()))
+        tokenizer = WordTokenizer(["a b", "b c"])
+        tokenizer.train()
+        self.assertEqual(tokenizer.decode(tokenizer.tokenize("a d c")), "a <unk> c")
+
+    def test_batch_decode_skips_padding(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        expected = [' '.join(sentence.split()) for sentence in self.text]
+        batch = tokenizer.encode_batch(self.text)
+        self.assertEqual(tokenizer.batch_decode(batch["input_ids"]), expected)
+        self.assertEqual(tokenizer.batch_decode(tokenizer.tokenize(self.text, padding=True)), expected)
+        self.assertEqual(tokenizer.decode(batch["input_ids"][0]), expected[0])
+
+    def test_decode_after_more_training(self):
+        tokenizer = WordTokenizer(["a b"])
+        tokenizer.train()
+        self.assertEqual(tokenizer.decode([2, 3]), "a b")
+        tokenizer.train(corpus=["c"])
+        self.assertEqual(tokenizer.decode([tokenizer.vocab["c"]]), "c")
+
+    def test_attached_decode(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "tokenizer.bin")
+            tokenizer = BPETokenizer(self.corpus)
+            tokenizer.train(n_iter=100)
+            tokenizer.save(path)
+            attached = BPETokenizer.attach(path)
+            batch = tokenizer.encode_batch(self.text)
+            self.assertEqual(attached.batch_decode(batch["input_ids"]), tokenizer.batch_decode(batch["input_ids"]))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_out_of_range_ids(self):
+        # 음수 id가 table 끝의 토큰으로 바뀌지 않아야 함
+        tokenizer = WordTokenizer(["hello world"])
+        tokenizer.train()
+        for ids in ([-1], [0, len(tokenizer.vocab)]):
+            with self.assertRaises(ValueError):
+                tokenizer.decode(ids)
+            with self.assertRaises(ValueError):
+                tokenizer.batch_decode([ids])
+            with self.assertRaises(ValueError):
+                tokenizer.batch_decode(np.array([ids]))
+        self.assertEqual(tokenizer.decode([]), "")
+
+    def test_untrained(self):
+        with self.assertRaises(ValueError):
+            BPETokenizer(self.corpus).decode([2])
+
+
+class TestEncodeToFile(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "tokens.bin")
+
+    def test_bpe_encode_to_file(self):
+        tokenizer = BPETokenizer(self.corpus)
+        tokenizer.train(n_iter=100)
+        # generator를 chunk 단위로 저장해도 tokenize와 같아야 함
+        docs = tokenizer.encode_to_file(iter(self.corpus), self.path, chunk_size=17)
+        self.assertEqual(docs.tokens.dtype, np.uint16)
+        self.assertEqual(len(docs), len(self.corpus))
+        self.assertEqual([doc.tolist() for doc in docs], tokenizer.tokenize(self.corpus))
+        self.assertEqual(docs.lengths().tolist(), [len(ids) for ids in tokenizer.tokenize(self.corpus)])
+
+    def test_parallel_and_max_length(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        docs = tokenizer.encode_to_file(iter(self.corpus), self.path, max_length=5, num_workers=2, chunk_size=17)
+        self.assertEqual([doc.tolist() for doc in docs[-3:]], tokenizer.tokenize(self.corpus[-3:], max_length=5))
+        self.assertEqual(len(docs), len(self.corpus))
+
+    def test_failed_encode_keeps_old_file(self):
+        # 중간에 에러가 나면 잘린 파일을 남기지 않고 기존 파일을 유지
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        tokenizer.encode_to_file(self.corpus[:3], self.path)
+
+        def failing():
+            yield from self.corpus
+            raise RuntimeError("read error")
+
+        with self.assertRaises(RuntimeError):
+            tokenizer.encode_to_file(failing(), self.path, chunk_size=17)
+        self.assertEqual(len(TokenFile(self.path)), 3)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["tokens.bin", "tokens.bin.idx"])
+
+    def test_uint32_and_empty(self):
+        tokenizer = WordTokenizer(self.corpus)
+        tokenizer.train()
+        tokenizer.vocab.update({f"w{i}": len(tokenizer.vocab) + i for i in range(2 ** 16)})
+        docs = tokenizer.encode_to_file(["w65000 ab", ""], self.path)
+        self.assertEqual(docs.tokens.dtype, np.uint32)
+        self.assertEqual(docs[0].tolist(), tokenizer.tokenize("w65000 ab"))
+        self.assertEqual(len(docs[1]), 0)
+        self.assertEqual(len(tokenizer.encode_to_file([], self.path)), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+class TestCountWords(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = make_corpus()
+
+    @mock.patch.object(tokenizers, 'CHUNK_SIZE', 30)
+    def test_parallel_same_as_serial(self):
+        serial = count_words(self.corpus)
+        parallel = count_words(self.corpus, num_workers=2)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(list(parallel), list(serial))
+        self.assertEqual(get_vocab(self.corpus, num_workers=2), get_vocab(self.corpus))
+
+    @mock.patch.object(tokenizers, 'CHUNK_SIZE', 30)
+    def test_word_tokenizer_train_parallel(self):
+        serial = WordTokenizer(self.corpus)
+        serial.train()
+        parallel = WordTokenizer(self.corpus)
+        parallel.train(num_workers=2)
+        self.assertEqual(parallel.vocab, serial.vocab)
+
+if __name__ == '__main__':
+    unittest.main()